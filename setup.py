@@ -33,4 +33,7 @@ setup(name='tfmodelzoo',
     ],
     keywords='tensorflow, deep learning, imagenet',
     install_requires=['tensorflow>=1.6'],
+    entry_points={
+        'console_scripts': ['tfmodelzoo=tfmodelzoo:main'],
+    },
 )
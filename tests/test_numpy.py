@@ -0,0 +1,201 @@
+import json
+
+import numpy as np
+import pytest
+
+import tfmodelzoo
+
+
+def _images():
+    return np.random.RandomState(0).randint(0, 256, (2, 4, 5, 3)).astype(
+        np.uint8)
+
+
+@pytest.mark.parametrize('mode, expected', [
+    ('caffe', lambda x: x[..., ::-1] - np.array([103.939, 116.779, 123.68])),
+    ('tf', lambda x: x / 127.5 - 1.),
+    ('torch', lambda x: (x / 255. - np.array([0.485, 0.456, 0.406])) /
+     np.array([0.229, 0.224, 0.225])),
+])
+def test_preprocess_input_modes(mode, expected):
+    x = _images()
+    output = tfmodelzoo.preprocess_input(x, mode=mode)
+    assert output.dtype == np.float32
+    np.testing.assert_allclose(output, expected(x.astype(np.float64)),
+                               rtol=1e-5, atol=1e-4)
+
+
+def test_preprocess_input_mode_of_model():
+    x = _images()
+    np.testing.assert_array_equal(
+        tfmodelzoo.preprocess_input(x, model='ResNet50'),
+        tfmodelzoo.preprocess_input(x, mode='caffe'))
+    np.testing.assert_array_equal(
+        tfmodelzoo.preprocess_input(x, model='Xception'),
+        tfmodelzoo.preprocess_input(x, mode='tf'))
+    np.testing.assert_array_equal(tfmodelzoo.preprocess_input(x),
+                                  tfmodelzoo.preprocess_input(x, mode='torch'))
+    with pytest.raises(ValueError):
+        tfmodelzoo.preprocess_input(x, model='ResNet51')
+    with pytest.raises(ValueError):
+        tfmodelzoo.preprocess_input(x, mode='keras')
+
+
+def test_preprocess_input_inplace():
+    x = _images().astype(np.float32)
+    original = x.copy()
+    tfmodelzoo.preprocess_input(x, mode='tf')
+    np.testing.assert_array_equal(x, original)
+
+    output = tfmodelzoo.preprocess_input(x, mode='tf', inplace=True)
+    assert np.shares_memory(output, x)
+
+
+def _decoder(tmp_path, classes=10):
+    path = str(tmp_path / 'labels.json')
+    with open(path, 'w') as f:
+        json.dump({str(i): ['n{:08d}'.format(i), 'class{}'.format(i)]
+                   for i in range(classes)}, f)
+    return tfmodelzoo.LabelDecoder(path)
+
+
+def test_label_decoder_top_k(tmp_path):
+    decoder = _decoder(tmp_path)
+    predictions = np.random.RandomState(0).rand(4, 10)
+
+    indices, scores = decoder.top_k(predictions, 3)
+    np.testing.assert_array_equal(indices,
+                                  np.argsort(-predictions, axis=1)[:, :3])
+    np.testing.assert_array_equal(
+        scores, np.take_along_axis(predictions, indices, axis=1))
+    assert decoder.decode(predictions, 1)[0] == [
+        ('n{:08d}'.format(indices[0, 0]), 'class{}'.format(indices[0, 0]),
+         scores[0, 0])]
+
+    # k is capped at the number of classes
+    indices, _ = decoder.top_k(predictions, 20)
+    assert indices.shape == (4, 10)
+    with pytest.raises(ValueError):
+        decoder.top_k(predictions[:, :5])
+
+
+def test_label_decoder_text_file(tmp_path):
+    path = str(tmp_path / 'labels.txt')
+    with open(path, 'w') as f:
+        f.write('cat\ndog\n\nbird\n')
+    decoder = tfmodelzoo.LabelDecoder(path)
+    assert len(decoder) == 3
+    assert decoder.decode([[0.1, 0.2, 0.7]], 2)[0] == [('2', 'bird', 0.7),
+                                                       ('1', 'dog', 0.2)]
+
+
+@pytest.mark.parametrize('size, tile, stride, expected', [
+    (10, 10, 5, [0]),
+    (10, 4, 4, [0, 4, 6]),
+    (10, 4, 3, [0, 3, 6]),
+    (12, 4, 2, [0, 2, 4, 6, 8]),
+])
+def test_tile_offsets(size, tile, stride, expected):
+    assert tfmodelzoo._tile_offsets(size, tile, stride) == expected
+
+
+def test_tile_offsets_of_small_image():
+    with pytest.raises(ValueError):
+        tfmodelzoo._tile_offsets(3, 4, 2)
+
+
+def test_tta_boxes():
+    boxes = tfmodelzoo._tta_boxes(0.8)
+    assert sorted(boxes) == sorted(tfmodelzoo.TTA_VIEWS)
+    assert boxes['identity'] == (0., 0., 1., 1.)
+    np.testing.assert_allclose(boxes['center'], (0.1, 0.1, 0.9, 0.9))
+    np.testing.assert_allclose(boxes['bottom_right'], (0.2, 0.2, 1., 1.))
+    assert boxes['flip'] == (0., 1., 1., 0.)
+    for view in tfmodelzoo.TTA_VIEWS[7:]:
+        y1, x1, y2, x2 = boxes[view[len('flip_'):]]
+        assert boxes[view] == (y1, x2, y2, x1)
+    # every crop has the requested side
+    for view in tfmodelzoo.TEN_CROP:
+        y1, x1, y2, x2 = boxes[view]
+        np.testing.assert_allclose((y2 - y1, abs(x2 - x1)), (0.8, 0.8))
+
+
+def test_prediction_cache_evicts_least_recently_used():
+    cache = tfmodelzoo.PredictionCache(max_bytes=3 * 40)
+    keys = [cache.key('ns', np.full(2, i)) for i in range(4)]
+    for key in keys[:3]:
+        cache.put(key, np.zeros(10, np.float32))
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[3], np.zeros(10, np.float32))
+
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) is not None for key in (keys[0], keys[2],
+                                                      keys[3]))
+    info = cache.info()
+    assert info['evictions'] == 1
+    assert info['entries'] == 3
+    assert info['bytes'] == 120
+    assert (info['hits'], info['misses']) == (4, 1)
+
+
+def test_prediction_cache_keys():
+    cache = tfmodelzoo.PredictionCache()
+    x = np.arange(6, dtype=np.uint8)
+    assert cache.key('a', x) == cache.key('a', x.copy())
+    assert cache.key('a', x) != cache.key('b', x)
+    assert cache.key('a', x) != cache.key('a', x.reshape(2, 3))
+    assert cache.key('a', x) != cache.key('a', x.astype(np.int8))
+    assert cache.key('a', b'jpeg') != cache.key('a', np.frombuffer(
+        b'jpeg', np.uint8))
+
+    output = cache.put(cache.key('a', x), [1., 2.])
+    assert not output.flags.writeable
+    assert cache.get(cache.key('a', x), disk=False) is output
+    assert cache.get(cache.key('b', x), disk=False) is None
+    assert cache.info()['misses'] == 0
+
+
+def test_prediction_cache_shared_tier(tmp_path):
+    path = str(tmp_path / 'predictions.db')
+    writer = tfmodelzoo.PredictionCache(path=path)
+    key = writer.key('ns', np.ones(3))
+    writer.put(key, np.arange(6, dtype=np.float32).reshape(2, 3))
+
+    # another process opening the same database, with an empty memory tier
+    reader = tfmodelzoo.PredictionCache(path=path)
+    assert reader.get(key, disk=False) is None
+    output = reader.get(key)
+    np.testing.assert_array_equal(output, np.arange(6).reshape(2, 3))
+    assert output.dtype == np.float32
+    assert reader.get(key) is output
+    info = reader.info()
+    assert (info['hits'], info['disk_hits'], info['misses']) == (1, 1, 0)
+    assert info['hit_rate'] == 1.
+
+    assert reader.get(reader.key('ns', np.zeros(3))) is None
+    assert reader.info()['misses'] == 1
+
+
+class _CountingSession(object):
+
+    def __init__(self):
+        self.batches = []
+
+    def run(self, fetches, feed_dict):
+        batch, = feed_dict.values()
+        self.batches.append(len(batch))
+        return batch.sum(axis=1, keepdims=True)
+
+
+def test_prediction_cache_run_skips_cached_and_duplicate_inputs():
+    cache = tfmodelzoo.PredictionCache()
+    session = _CountingSession()
+    inputs = [np.full(2, i, np.float32) for i in (1, 2, 1)]
+
+    outputs = cache.run(session, 'X', 'Y', inputs, 'ns')
+    np.testing.assert_array_equal(outputs, [[2.], [4.], [2.]])
+    outputs = cache.run(session, 'X', 'Y', inputs + [np.full(2, 3,
+                                                              np.float32)],
+                        'ns')
+    np.testing.assert_array_equal(outputs, [[2.], [4.], [2.], [6.]])
+    assert session.batches == [2, 1]
@@ -0,0 +1,197 @@
+import os
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+import tfmodelzoo
+
+
+def _write_jpegs(directory, count, size=(64, 48)):
+    paths = []
+    graph = tf.Graph()
+    with graph.as_default(), tf.Session(graph=graph) as sess:
+        image = tf.placeholder(tf.uint8, size + (3,))
+        encode = tf.image.encode_jpeg(image)
+        for i in range(count):
+            path = os.path.join(directory, '{}.jpg'.format(i))
+            pixels = np.random.randint(0, 256, size + (3,), dtype=np.uint8)
+            with open(path, 'wb') as f:
+                f.write(sess.run(encode, {image: pixels}))
+            paths.append(path)
+    return paths
+
+
+def test_export_embeddings_default_call(tmp_path):
+    paths = _write_jpegs(str(tmp_path), 3)
+    output_dir = str(tmp_path / 'embeddings')
+    index = tfmodelzoo.export_embeddings('MobileNet', paths, output_dir,
+                                         weights=None)
+
+    assert index['count'] == 3
+    assert index['dim'] == tfmodelzoo.MODELS['MobileNet'].features
+    (ids, embeddings), = tfmodelzoo.load_embeddings(output_dir)
+    assert ids == paths
+    assert embeddings.shape == (3, index['dim'])
+    assert np.isfinite(embeddings).all()
+
+
+def test_models_on_one_session_are_cached_separately():
+    # same arguments, different models: the cache key must tell them apart
+    kwargs = dict(weights=None, include_top=False, pooling='avg',
+                  input_shape=(64, 64, 3))
+    sess = tf.Session(graph=tf.Graph())
+    X1, Y1 = tfmodelzoo.ResNet50(sess, **kwargs)
+    X2, Y2 = tfmodelzoo.MobileNet(sess, **kwargs)
+
+    assert X1 is not X2
+    images = np.random.uniform(-1, 1, (2, 64, 64, 3)).astype(np.float32)
+    resnet, mobilenet = sess.run([Y1, Y2], {X1: images, X2: images})
+    assert resnet.shape == (2, 2048)
+    assert mobilenet.shape == (2, 1024)
+
+
+_SMALL_MOBILENET = dict(weights=None, alpha=0.25, input_shape=(128, 128, 3))
+
+
+@pytest.mark.parametrize('options', [
+    dict(preprocess=True),
+    dict(input_format='uint8'),
+    dict(input_format='jpeg'),
+    dict(batch_size=2),
+    dict(input_format='uint8', tta=tfmodelzoo.TEN_CROP),
+])
+def test_input_pipelines(options):
+    sess = tf.Session(graph=tf.Graph())
+    X, Y = tfmodelzoo.MobileNet(sess, **dict(_SMALL_MOBILENET, **options))
+    if options.get('input_format') == 'jpeg':
+        images = tfmodelzoo._synthetic_batch(X, 2)
+    else:
+        images = np.random.randint(0, 256, (2, 160, 160, 3) if
+                                   options.get('input_format') == 'uint8'
+                                   else (2, 128, 128, 3)).astype(
+                                       X.dtype.as_numpy_dtype)
+    output = sess.run(Y, {X: images})
+    assert output.shape == (2, 1000)
+    np.testing.assert_allclose(output.sum(axis=1), 1, rtol=1e-4)
+
+
+def test_quantized_models_are_cached():
+    sess = tf.Session(graph=tf.Graph())
+    X1, Y1 = tfmodelzoo.MobileNet(sess, quantize='fp16', **_SMALL_MOBILENET)
+    nodes = len(sess.graph.get_operations())
+    hits = tfmodelzoo.model_cache_info()['hits']
+    X2, Y2 = tfmodelzoo.MobileNet(sess, quantize='fp16', **_SMALL_MOBILENET)
+
+    assert (X2, Y2) == (X1, Y1)
+    assert len(sess.graph.get_operations()) == nodes
+    assert tfmodelzoo.model_cache_info()['hits'] == hits + 1
+    X3, _ = tfmodelzoo.MobileNet(sess, quantize='int8', **_SMALL_MOBILENET)
+    assert X3 is not X1
+
+
+def test_weight_store_loads_models_sharing_a_graph(tmp_path):
+    # InceptionV3 layers are auto-numbered, so a second model in the same
+    # graph gets different layer names than the stored ones
+    images = np.random.uniform(-1, 1, (1, 75, 75, 3)).astype(np.float32)
+    graph = tf.Graph()
+    with graph.as_default(), tf.Session(graph=graph) as sess, \
+            sess.as_default():
+        reference = tf.keras.applications.InceptionV3(
+            weights=None, include_top=False, input_shape=(75, 75, 3))
+        h5 = str(tmp_path / 'inception_v3.h5')
+        reference.save_weights(h5)
+        expected = reference.predict(images)
+        mixed2 = tf.keras.backend.function(
+            [reference.input], [reference.get_layer('mixed2').output])(
+                [images])[0]
+    store = tfmodelzoo.WeightStore(str(tmp_path / 'store'))
+    store.add('InceptionV3', weights=h5, include_top=False)
+
+    sess = tf.Session(graph=tf.Graph())
+    kwargs = dict(weight_store=store, include_top=False,
+                  input_shape=(75, 75, 3), cache=False)
+    for _ in range(2):
+        X, Y = tfmodelzoo.InceptionV3(sess, **kwargs)
+        np.testing.assert_allclose(sess.run(Y, {X: images}), expected,
+                                   rtol=1e-4, atol=1e-4)
+    X, Y = tfmodelzoo.InceptionV3(sess, cut_at='mixed2', **kwargs)
+    np.testing.assert_allclose(sess.run(Y, {X: images}), mixed2, rtol=1e-4,
+                               atol=1e-4)
+
+
+def _randomize_batch_norms(sess):
+    # weights=None leaves batch normalization an identity, which folding
+    # could get wrong unnoticed
+    random = np.random.RandomState(0)
+    with sess.graph.as_default():
+        for variable in tf.global_variables():
+            shape = variable.shape.as_list()
+            if 'moving_variance' in variable.name:
+                variable.load(random.uniform(0.5, 2, shape), sess)
+            elif any(name in variable.name for name in
+                     ('moving_mean', 'gamma', 'beta')):
+                variable.load(random.uniform(-1, 1, shape), sess)
+
+
+def _assert_optimization_preserves_outputs(sess, X, Y, images):
+    graph_def = tfmodelzoo.optimize_for_inference(sess, X, Y)
+    assert not [node.name for node in graph_def.node
+                if node.op.startswith('FusedBatchNorm')]
+    result = tfmodelzoo.optimization_error(sess, X, Y, images)
+    scale = np.abs(sess.run(Y, {X: images})).max()
+    assert result['max_abs_error'] <= 1e-4 * max(scale, 1)
+    assert result['nodes_after'] < result['nodes_before']
+    return result
+
+
+def test_optimization_error_of_mobilenet():
+    sess = tf.Session(graph=tf.Graph())
+    X, Y = tfmodelzoo.MobileNet(sess, **_SMALL_MOBILENET)
+    _randomize_batch_norms(sess)
+    images = np.random.uniform(-1, 1, (2, 128, 128, 3)).astype(np.float32)
+    result = _assert_optimization_preserves_outputs(sess, X, Y, images)
+    assert result['top1_agreement'] == 1.
+
+
+def test_optimization_error_of_conv_bias_batch_norm_block():
+    graph = tf.Graph()
+    sess = tf.Session(graph=graph)
+    with graph.as_default(), sess.as_default():
+        inputs = tf.keras.layers.Input((16, 16, 3))
+        x = tf.keras.layers.Conv2D(8, 3, padding='same')(inputs)
+        x = tf.keras.layers.BatchNormalization()(x)
+        x = tf.keras.layers.Activation('relu')(x)
+        x = tf.keras.layers.Conv2D(8, 1)(x)
+        x = tf.keras.layers.BatchNormalization()(x)
+        outputs = tf.keras.layers.add([x, tf.keras.layers.Conv2D(8, 1)(
+            inputs)])
+        model = tf.keras.Model(inputs, outputs)
+        tf.keras.backend.get_session()
+        for layer in model.layers:
+            if isinstance(layer, tf.keras.layers.Conv2D):
+                kernel, bias = layer.get_weights()
+                layer.set_weights([kernel, np.random.uniform(-1, 1,
+                                                             bias.shape)])
+    _randomize_batch_norms(sess)
+    images = np.random.uniform(-1, 1, (2, 16, 16, 3)).astype(np.float32)
+    _assert_optimization_preserves_outputs(sess, model.input, model.output,
+                                           images)
+
+
+def test_own_intra_pool_is_opt_in(monkeypatch):
+    monkeypatch.delenv('TF_OVERRIDE_GLOBAL_THREADPOOL', raising=False)
+    tfmodelzoo.make_inference_session().close()
+    assert 'TF_OVERRIDE_GLOBAL_THREADPOOL' not in os.environ
+    tfmodelzoo.make_inference_session(own_intra_pool=True).close()
+    assert os.environ['TF_OVERRIDE_GLOBAL_THREADPOOL'] == '1'
+
+
+def test_bench_times_each_stage():
+    result, = tfmodelzoo.bench(['MobileNet'], batch_sizes=(1,), runs=2,
+                               warmup_runs=0, isolate=False)
+    assert result['parameters'] == tfmodelzoo.MODELS['MobileNet'].parameters
+    for stage in ('build_seconds', 'init_seconds', 'load_seconds'):
+        assert result[stage] > 0
+    assert [batch['batch_size'] for batch in result['batches']] == [1]
@@ -1,29 +1,752 @@
-import tensorflow as tf
-from tensorflow.python.keras.applications.densenet import decode_predictions, preprocess_input
+import argparse
+import asyncio
+import difflib
+import functools
+import hashlib
+import importlib
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
 
-def _get_model(sess, model, include_tensors, **kwargs):
-    # preserve previous tf.keras session and replace with current
-    old_sess = tf.keras.backend.get_session()
-    tf.keras.backend.set_session(sess)
 
-    # load tf.keras model via applications module
-    mod = model(**kwargs)
+class _LazyModule(object):
+    # imports a module on first attribute access, so that importing tfmodelzoo
+    # (e.g. to query MODELS) does not pay for TensorFlow or NumPy
 
-    # get input tensor for feeddict needs and get output tensor
-    X = mod.get_input_at(0)
-    Y = mod.get_output_at(0)
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+np = _LazyModule('numpy')
+tf = _LazyModule('tensorflow')
+
+ModelInfo = namedtuple('ModelInfo', ['name', 'input_shape', 'preprocessing',
+                                     'parameters', 'outputs', 'features'])
+ModelInfo.__doc__ = """Description of a model, available without importing
+TensorFlow.
+
+# Fields:
+    name (str): name of the model and of its getter.
+    input_shape (tuple): default input shape when the top is included.
+    preprocessing (str): mode of `preprocess_input` the weights expect:
+            `'caffe'` (RGB to BGR, then zero-centered on the ImageNet channel
+            means), `'tf'` (scaled to [-1, 1]) or `'torch'` (scaled to [0, 1],
+            then normalized with the ImageNet mean and std).
+    parameters (int): number of parameters with the top included.
+    outputs (int): size of the output, i.e. number of ImageNet classes.
+    features (int): size of the output without the top, with pooling.
+"""
+
+# every model provided by this module
+MODELS = OrderedDict((info.name, info) for info in [
+    ModelInfo('DenseNet121', (224, 224, 3), 'torch', 8062504, 1000, 1024),
+    ModelInfo('DenseNet169', (224, 224, 3), 'torch', 14307880, 1000, 1664),
+    ModelInfo('DenseNet201', (224, 224, 3), 'torch', 20242984, 1000, 1920),
+    ModelInfo('InceptionResNetV2', (299, 299, 3), 'tf', 55873736, 1000, 1536),
+    ModelInfo('InceptionV3', (299, 299, 3), 'tf', 23851784, 1000, 2048),
+    ModelInfo('MobileNet', (224, 224, 3), 'tf', 4253864, 1000, 1024),
+    ModelInfo('NASNetLarge', (331, 331, 3), 'tf', 88949818, 1000, 4032),
+    ModelInfo('NASNetMobile', (224, 224, 3), 'tf', 5326716, 1000, 1056),
+    ModelInfo('ResNet50', (224, 224, 3), 'caffe', 25636712, 1000, 2048),
+    ModelInfo('VGG16', (224, 224, 3), 'caffe', 138357544, 1000, 512),
+    ModelInfo('VGG19', (224, 224, 3), 'caffe', 143667240, 1000, 512),
+    ModelInfo('Xception', (299, 299, 3), 'tf', 22910480, 1000, 2048),
+])
+
+_CAFFE_MEAN_RGB = (123.68, 116.779, 103.939)
+_TORCH_MEAN = (0.485, 0.456, 0.406)
+_TORCH_STD = (0.229, 0.224, 0.225)
+
+
+def _preprocessing_mode(model=None, mode=None):
+    if mode is None:
+        if model is None:
+            # matches the keras.applications.densenet function this module
+            # used to export
+            return 'torch'
+        if model not in MODELS:
+            raise ValueError('Unknown model {!r}'.format(model))
+        mode = MODELS[model].preprocessing
+    if mode not in ('caffe', 'tf', 'torch'):
+        raise ValueError('Unknown preprocessing mode {!r}'.format(mode))
+    return mode
+
+
+def _preprocess_tensor(x, mode):
+    x = tf.cast(x, tf.float32)
+    if mode == 'caffe':
+        return tf.reverse(x, axis=[-1]) - _CAFFE_MEAN_RGB[::-1]
+    if mode == 'tf':
+        return x * (1. / 127.5) - 1.
+    scale = [1. / (255. * s) for s in _TORCH_STD]
+    offset = [m / s for m, s in zip(_TORCH_MEAN, _TORCH_STD)]
+    return x * scale - offset
+
+
+def preprocess_input(x, model=None, mode=None, inplace=False):
+    """Preprocesses a batch of channels-last RGB images the way the given
+    model's ImageNet weights expect.
+
+    NumPy inputs are converted to float32 at most once and then transformed
+    in place, so no float64 or intermediate copies of the batch are made.
+    TensorFlow tensors are transformed with graph ops instead.
+
+    # Arguments:
+        x: images as a NumPy array (any numeric dtype) or a tensor.
+        model (str): name of the model the images are fed to, e.g.
+                    `'ResNet50'`. Selects the matching preprocessing mode.
+        mode (str): explicit preprocessing mode, one of `'caffe'`, `'tf'` or
+                    `'torch'`. If neither `model` nor `mode` is given, the
+                    DenseNet (`'torch'`) preprocessing is applied.
+        inplace (bool): allow a float32 NumPy `x` to be overwritten instead
+                    of copied.
+
+    # Returns:
+        The preprocessed images as float32. For `'caffe'` preprocessing of a
+        NumPy array this is a channel-reversed view of the transformed buffer.
+    """
+    mode = _preprocessing_mode(model, mode)
+    # x can only be a tensor once TensorFlow has been imported
+    if 'tensorflow' in sys.modules and isinstance(x, (tf.Tensor, tf.Variable)):
+        return _preprocess_tensor(x, mode)
+
+    x = np.asarray(x)
+    if not (inplace and x.dtype == np.float32):
+        x = x.astype(np.float32)
+    if mode == 'caffe':
+        # subtract the means in RGB order, then reverse the channels as a view
+        x -= np.array(_CAFFE_MEAN_RGB, dtype=np.float32)
+        return x[..., ::-1]
+    if mode == 'tf':
+        x *= np.float32(1. / 127.5)
+        x -= np.float32(1.)
+        return x
+    x *= np.array([1. / (255. * s) for s in _TORCH_STD], dtype=np.float32)
+    x -= np.array([m / s for m, s in zip(_TORCH_MEAN, _TORCH_STD)],
+                  dtype=np.float32)
+    return x
+
+
+def _default_input_shape(model_name, kwargs):
+    if kwargs.get('input_shape') is not None:
+        return tuple(kwargs['input_shape'])
+    if kwargs.get('include_top', True):
+        return MODELS[model_name].input_shape
+    return (None, None, 3)
+
+# process-wide cache of built models. Entries are keyed by the session the
+# model was loaded on, the application name and its keyword arguments, and are
+# evicted least-recently-used first once either limit below is exceeded.
+_model_cache = OrderedDict()
+_model_cache_lock = threading.RLock()
+_model_cache_limits = {'max_entries': 32, 'max_bytes': None}
+_model_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+# `model` is the Keras model, or None for frozen models imported as constants,
+# whose output tensor is kept as `output` instead
+_CacheEntry = namedtuple('_CacheEntry', ['session', 'model', 'input', 'output',
+                                         'nbytes'])
+
+
+def _hashable(value):
+    # turn (possibly nested) keyword arguments into something usable as a dict
+    # key, raising TypeError for values that cannot be compared reliably
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    hash(value)
+    return value
+
+
+def _cache_key(sess, model_name, kwargs):
+    # keyed on the registry name: tf.keras.applications functions are wrapped
+    # without functools.wraps in some TensorFlow versions, leaving all of them
+    # with the same __name__
+    try:
+        return (id(sess), model_name, _hashable(kwargs))
+    except TypeError:
+        return None
+
+
+def _model_nbytes(mod):
+    return sum(int(w.shape.num_elements()) * w.dtype.size for w in mod.weights)
+
+
+def _evict_models():
+    # drop entries of garbage-collected sessions, which can never hit again,
+    # then least-recently-used entries until the cache is within its limits
+    for key in [key for key, entry in _model_cache.items()
+                if entry.session() is None]:
+        del _model_cache[key]
+        _model_cache_stats['evictions'] += 1
+    max_entries = _model_cache_limits['max_entries']
+    max_bytes = _model_cache_limits['max_bytes']
+    total = sum(entry.nbytes for entry in _model_cache.values())
+    while _model_cache and (
+            (max_entries is not None and len(_model_cache) > max_entries) or
+            (max_bytes is not None and total > max_bytes)):
+        _, entry = _model_cache.popitem(last=False)
+        total -= entry.nbytes
+        _model_cache_stats['evictions'] += 1
+
+
+def _cache_lookup(key, sess):
+    # the entry cached under `key` for `sess`, counting the hit or miss
+    with _model_cache_lock:
+        entry = _model_cache.get(key)
+        if entry is not None and entry.session() is sess:
+            _model_cache.move_to_end(key)
+            _model_cache_stats['hits'] += 1
+            return entry
+        _model_cache_stats['misses'] += 1
+        _evict_models()
+        return None
+
+
+def _cache_insert(key, entry):
+    with _model_cache_lock:
+        _model_cache[key] = entry
+        _evict_models()
+
+
+def model_cache_info():
+    """Returns hit/miss statistics and the current size of the model cache.
+
+    # Returns:
+        A dict with the `hits`, `misses` and `evictions` counters, the number
+        of cached `entries`, their estimated weight size in `bytes` and the
+        configured `max_entries` and `max_bytes` limits.
+    """
+    with _model_cache_lock:
+        info = dict(_model_cache_stats)
+        info['entries'] = len(_model_cache)
+        info['bytes'] = sum(entry.nbytes for entry in _model_cache.values())
+        info.update(_model_cache_limits)
+        return info
+
+
+def set_model_cache_limits(max_entries=32, max_bytes=None):
+    """Configures the least-recently-used eviction policy of the model cache.
+
+    Evicting an entry only releases the cache's reference to the Keras model;
+    the graph and variables stay alive for as long as the session they were
+    loaded on does.
+
+    # Arguments:
+        max_entries (int): maximum number of cached models, or `None` for no
+                        limit.
+        max_bytes (int): maximum estimated size of the cached models' weights
+                        in bytes, or `None` for no limit.
+    """
+    with _model_cache_lock:
+        _model_cache_limits['max_entries'] = max_entries
+        _model_cache_limits['max_bytes'] = max_bytes
+        _evict_models()
+
+
+def clear_model_cache():
+    """Empties the model cache and resets its statistics."""
+    with _model_cache_lock:
+        _model_cache.clear()
+        for name in _model_cache_stats:
+            _model_cache_stats[name] = 0
+
+
+def _input_pipeline(model_name, input_format, preprocess, shape,
+                    batch_size=None):
+    # returns the placeholder fed by the user and the tensor fed to the model
+    if input_format == 'float':
+        X = tf.placeholder(tf.float32, (batch_size,) + shape, name='images')
+        images = X
+    elif input_format == 'uint8':
+        X = tf.placeholder(tf.uint8, (batch_size, None, None, 3),
+                           name='images')
+        with tf.name_scope('resize'):
+            images = tf.cast(X, tf.float32)
+            if None not in shape[:2]:
+                images = tf.image.resize_images(images, shape[:2])
+    elif input_format == 'jpeg':
+        if None in shape[:2]:
+            raise ValueError('An `input_shape` is required to batch images '
+                             'of different sizes with input_format="jpeg"')
+
+        def decode(contents):
+            image = tf.image.decode_image(contents, channels=3)
+            image.set_shape((None, None, 3))
+            return tf.image.resize_images(image, shape[:2])
+
+        X = tf.placeholder(tf.string, (batch_size,), name='images')
+        with tf.name_scope('decode'):
+            images = tf.map_fn(decode, X, dtype=tf.float32, back_prop=False)
+    else:
+        raise ValueError('Unknown input_format {!r}, expected "float", '
+                         '"uint8" or "jpeg"'.format(input_format))
+
+    if preprocess:
+        with tf.name_scope('preprocess'):
+            images = _preprocess_tensor(images,
+                                        MODELS[model_name].preprocessing)
+    return X, images
+
+
+# views for test-time augmentation: the whole image, a center crop and four
+# corner crops, each also flipped horizontally
+TTA_VIEWS = ('identity', 'center', 'top_left', 'top_right', 'bottom_left',
+             'bottom_right', 'flip', 'flip_center', 'flip_top_left',
+             'flip_top_right', 'flip_bottom_left', 'flip_bottom_right')
+TEN_CROP = TTA_VIEWS[1:6] + TTA_VIEWS[7:]
+
+
+def _tta_boxes(crop):
+    # crop_and_resize boxes (y1, x1, y2, x2) of each view in relative
+    # coordinates. Swapping x1 and x2 samples a horizontally flipped crop
+    margin = 1. - crop
+    boxes = {'identity': (0., 0., 1., 1.),
+             'center': (margin / 2, margin / 2, 1. - margin / 2,
+                        1. - margin / 2),
+             'top_left': (0., 0., crop, crop),
+             'top_right': (0., margin, crop, 1.),
+             'bottom_left': (margin, 0., 1., crop),
+             'bottom_right': (margin, margin, 1., 1.)}
+    for name, (y1, x1, y2, x2) in list(boxes.items()):
+        boxes['flip_' + name] = (y1, x2, y2, x1)
+    boxes['flip'] = boxes.pop('flip_identity')
+    return boxes
+
+
+def _tta_views(images, views, crop, size):
+    # all views of all images as one batch, with the views of each image
+    # consecutive, cropped and resized to the model's input size in one op
+    boxes = _tta_boxes(crop)
+    unknown = [view for view in views if view not in boxes]
+    if unknown:
+        raise ValueError('Unknown tta views {}, expected some of {}'.format(
+            ', '.join(map(repr, unknown)), ', '.join(TTA_VIEWS)))
+    if None in size:
+        raise ValueError('An `input_shape` is required for tta')
+    with tf.name_scope('tta'):
+        n = tf.shape(images)[0]
+        view_boxes = tf.constant([boxes[view] for view in views], tf.float32)
+        box_ind = tf.reshape(tf.tile(tf.range(n)[:, tf.newaxis],
+                                     [1, len(views)]), [-1])
+        return tf.image.crop_and_resize(images, tf.tile(view_boxes, [n, 1]),
+                                        box_ind, size)
+
+
+def _tta_reduce(tensor, views, reduce):
+    # combine the views of each image, shared between calls via its name
+    if reduce not in ('mean', 'max'):
+        raise ValueError('Unknown tta_reduce {!r}, expected "mean" or '
+                         '"max"'.format(reduce))
+    name = 'tta_reduce/{}_{}'.format(tensor.op.name.replace('/', '_'),
+                                     reduce)
+    try:
+        return tensor.graph.get_tensor_by_name(name + ':0')
+    except KeyError:
+        pass
+    with tensor.graph.as_default():
+        grouped = tf.reshape(tensor, tf.concat(
+            [[-1, len(views)], tf.shape(tensor)[1:]], 0))
+        reduce = tf.reduce_mean if reduce == 'mean' else tf.reduce_max
+        reduced = reduce(grouped, axis=1, name=name)
+        reduced.set_shape([None] + tensor.shape.as_list()[1:])
+        return reduced
+
+
+# one lock per graph, serializing the Keras layer naming of models built into
+# the same graph while models for different graphs are built in parallel
+_graph_locks = weakref.WeakKeyDictionary()
+_graph_locks_lock = threading.Lock()
+
+
+def _graph_lock(graph):
+    with _graph_locks_lock:
+        return _graph_locks.setdefault(graph, threading.RLock())
+
+
+def _replay_layers(config, input_tensor=None):
+    # recreate the layers of a functional model config in the default graph,
+    # feeding its input layer from `input_tensor` if one is given
+    outputs = {}
+    pending = list(config['layers'])
+    while pending:
+        remaining = []
+        for layer_config in pending:
+            name = layer_config['name']
+            if layer_config['class_name'] == 'InputLayer':
+                if input_tensor is not None:
+                    outputs[name] = [tf.keras.layers.Input(tensor=input_tensor,
+                                                           name=name)]
+                else:
+                    outputs[name] = [tf.keras.layers.Input(
+                        batch_shape=layer_config['config']['batch_input_shape'],
+                        dtype=layer_config['config']['dtype'], name=name)]
+                continue
+            nodes = layer_config['inbound_nodes']
+            if any(inbound[0] not in outputs for node in nodes
+                   for inbound in node):
+                remaining.append(layer_config)
+                continue
+            layer = tf.keras.layers.deserialize({
+                'class_name': layer_config['class_name'],
+                'config': layer_config['config']})
+            for node in nodes:
+                inputs = [outputs[inbound[0]][inbound[2]] for inbound in node]
+                call_kwargs = node[0][3] if len(node[0]) > 3 else {}
+                output = layer(inputs if len(inputs) > 1 else inputs[0],
+                               **call_kwargs)
+            outputs[name] = output if isinstance(output, list) else [output]
+        if len(remaining) == len(pending):
+            raise ValueError('Cannot rebuild layers {}'.format(
+                ', '.join(layer_config['name'] for layer_config in pending)))
+        pending = remaining
+
+    inputs = [outputs[name][index] for name, _, index in config['input_layers']]
+    model_outputs = [outputs[name][index]
+                     for name, _, index in config['output_layers']]
+    return tf.keras.Model(inputs[0], model_outputs[0], name=config['name'])
+
+
+def _truncated_model(model, cut_at, input_tensor=None, weights='imagenet',
+                     assign=None, **kwargs):
+    # build the full model in a private graph to find the layers `cut_at`
+    # depends on, then recreate only those in the default graph. Weights,
+    # loaded by Keras or by calling `assign` on the full model, are copied
+    # over for those layers, after which the private graph is freed.
+    if input_tensor is not None and kwargs.get('input_shape') is None:
+        kwargs['input_shape'] = tuple(input_tensor.shape.as_list()[1:])
+    graph = tf.Graph()
+    with graph.as_default(), tf.Session(graph=graph) as sess, \
+            sess.as_default():
+        full = model(weights=weights, **kwargs)
+        if assign is not None:
+            assign(full)
+        if ':' in cut_at:
+            raise ValueError('cut_at expects a layer name, got {!r}'.format(
+                cut_at))
+        output = _layer_tensor(graph, full, cut_at)
+        truncated = tf.keras.Model(full.get_input_at(0), output)
+        config = truncated.get_config()
+        values = {}
+        if weights is not None or assign is not None:
+            values = {layer.name: tf.keras.backend.batch_get_value(
+                layer.weights) for layer in truncated.layers if layer.weights}
+
+    mod = _replay_layers(config, input_tensor)
+    tf.keras.backend.batch_set_value([
+        pair for layer in mod.layers if layer.name in values
+        for pair in zip(layer.weights, values[layer.name])])
+    return mod
+
+
+def _build_model(sess, model_name, cache=True, preprocess=False,
+                 input_format='float', weight_store=None, cut_at=None,
+                 batch_size=None, tta=None, tta_crop=0.875, **kwargs):
+    model = _application(model_name)
+    weight_store = _weight_store(weight_store)
+    key = _cache_key(sess, model_name, dict(kwargs, preprocess=preprocess,
+                                       input_format=input_format,
+                                       weight_store=weight_store and
+                                       weight_store.root,
+                                       cut_at=cut_at, batch_size=batch_size,
+                                       tta=tta and tuple(tta),
+                                       tta_crop=tta_crop)) \
+        if cache else None
+
+    # build on the session's graph with it as the default session, which
+    # tf.keras uses instead of its global session. Both are thread-local, so
+    # models load concurrently as long as they go to different graphs.
+    with _graph_lock(sess.graph), sess.graph.as_default(), sess.as_default():
+        entry = _cache_lookup(key, sess) if key is not None else None
+        if entry is not None:
+            return entry.input, entry.model
+
+        # prepend decoding, preprocessing and test-time augmentation ops to
+        # the model if requested, and feed it from a placeholder of static
+        # batch size if one is given
+        X = None
+        if preprocess or input_format != 'float' or batch_size is not None \
+                or tta:
+            shape = _default_input_shape(model_name, kwargs)
+            X, kwargs['input_tensor'] = _input_pipeline(
+                model_name, input_format,
+                preprocess or input_format != 'float', shape, batch_size)
+            if tta:
+                kwargs['input_tensor'] = _tta_views(
+                    kwargs['input_tensor'], tta, tta_crop, shape[:2])
+
+        # load tf.keras model via applications module, up to the cut_at layer
+        # if requested, taking ImageNet weights from the local weight store if
+        # one is configured
+        assign = None
+        if weight_store is not None and \
+                kwargs.get('weights', 'imagenet') == 'imagenet':
+            kwargs['weights'] = None
+            assign = functools.partial(weight_store.assign,
+                                       model_name=model_name)
+        if cut_at is None:
+            mod = model(**kwargs)
+            if assign is not None:
+                assign(mod)
+        else:
+            mod = _truncated_model(model, cut_at, assign=assign, **kwargs)
+        # tf.keras initializes the graph's uninitialized variables when it
+        # hands out the default session, which loading weights does but
+        # weights=None does not
+        tf.keras.backend.get_session()
+        if X is None:
+            X = mod.get_input_at(0)
+
+        if key is not None:
+            _cache_insert(key, _CacheEntry(weakref.ref(sess), mod, X,
+                                           mod.get_output_at(0),
+                                           _model_nbytes(mod)))
+    return X, mod
+
+
+def _available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def core_groups(n):
+    """Splits the cores this process may run on into `n` disjoint groups of
+    (nearly) equal size, for use as `core_set` of `make_inference_session`."""
+    cores = _available_cores()
+    if not 0 < n <= len(cores):
+        raise ValueError('Cannot split {} cores into {} groups'.format(
+            len(cores), n))
+    size, extra = divmod(len(cores), n)
+    groups, start = [], 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(cores[start:end])
+        start = end
+    return groups
+
+
+def make_inference_session(profile='latency', cores=None, core_set=None,
+                           graph=None, xla=False, own_intra_pool=False):
+    """Creates a session with thread pools sized for CPU inference.
+
+    TensorFlow runs ops on a process-wide intra-op thread pool, created with
+    the first session of the process and shared by all later ones. By
+    default, only the inter-op threads of later sessions are sized by
+    `profile` and `cores` and pinned to `core_set`; see `own_intra_pool` to
+    size and pin their intra-op threads as well.
+
+    # Arguments:
+        profile (str): `'latency'` runs one op at a time, parallelized over
+                    all cores, to finish single requests as fast as possible.
+                    `'throughput'` splits the cores between two concurrently
+                    running ops so that more batches complete per second.
+        cores (int): number of cores to size the thread pools for. Defaults
+                    to the size of `core_set`, or to all cores available to
+                    the process.
+        core_set: optional list of core ids to pin the session's threads to
+                    (Linux only, ignored elsewhere), e.g. one of
+                    `core_groups(n)`. Sessions pinned to disjoint core sets do
+                    not compete for cores.
+        graph (Graph): the graph to run, defaulting to a new graph.
+        xla (bool): whether to enable XLA JIT compilation.
+        own_intra_pool (bool): set `TF_OVERRIDE_GLOBAL_THREADPOOL` (if
+                    unset), which gives every session created in this process
+                    afterwards, including plain `tf.Session()`s, an intra-op
+                    pool of its own. It has no effect if a session was created
+                    before, or if TensorFlow does not read the variable.
+
+    # Returns:
+        A `tf.Session`.
+    """
+    if profile not in ('latency', 'throughput'):
+        raise ValueError('Unknown profile {!r}, expected "latency" or '
+                         '"throughput"'.format(profile))
+    if cores is None:
+        cores = len(core_set) if core_set else len(_available_cores())
+    # read by TensorFlow once, when the first session creates its devices
+    if own_intra_pool:
+        os.environ.setdefault('TF_OVERRIDE_GLOBAL_THREADPOOL', '1')
+    if profile == 'latency':
+        intra, inter = cores, 1
+    else:
+        intra, inter = max(1, cores // 2), 2
+
+    config = tf.ConfigProto(intra_op_parallelism_threads=intra,
+                            inter_op_parallelism_threads=inter,
+                            use_per_session_threads=core_set is not None,
+                            allow_soft_placement=True)
+    config.graph_options.optimizer_options.opt_level = tf.OptimizerOptions.L1
+    config.graph_options.optimizer_options.do_function_inlining = True
+    if xla:
+        config.graph_options.optimizer_options.global_jit_level = \
+            tf.OptimizerOptions.ON_1
+    graph = graph if graph is not None else tf.Graph()
+
+    # pinning needs sched_setaffinity, which macOS and Windows lack
+    if core_set is None or not hasattr(os, 'sched_setaffinity'):
+        return tf.Session(graph=graph, config=config)
+
+    # the session's thread pools are created along with it and inherit the
+    # affinity of the creating thread, which is restored afterwards
+    previous = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, core_set)
+    try:
+        return tf.Session(graph=graph, config=config)
+    finally:
+        os.sched_setaffinity(0, previous)
+
+
+# sessions created by the getters when none is passed, keyed by their graph
+_owned_sessions = weakref.WeakKeyDictionary()
+
+
+def get_session(tensor):
+    """Returns the session a model getter created for `tensor` when it was
+    called without a session, or `None` if the getter was given one."""
+    return _owned_sessions.get(tensor.graph)
+
+
+def _synthetic_batch(X, batch_size):
+    # random inputs matching the placeholder, with unknown image sides of 224
+    if X.dtype == tf.string:
+        graph = tf.Graph()
+        with graph.as_default(), tf.Session(graph=graph) as sess:
+            image = sess.run(tf.image.encode_jpeg(tf.zeros((224, 224, 3),
+                                                           tf.uint8)))
+        return np.array([image] * batch_size, dtype=object)
+    shape = [batch_size] + [d or 224 for d in X.shape.as_list()[1:]]
+    return np.random.uniform(0, 255, shape).astype(X.dtype.as_numpy_dtype)
+
+
+def _warmup(sess, X, fetches, batch_sizes):
+    static = X.shape.as_list()[0]
+    if batch_sizes is True:
+        batch_sizes = [static or 1]
+    for batch_size in batch_sizes:
+        if static not in (None, batch_size):
+            raise ValueError('Cannot warm up with a batch of {}, the input '
+                             'takes batches of {}'.format(batch_size, static))
+        sess.run(fetches, {X: _synthetic_batch(X, batch_size)})
+
+
+def warmup(session, X, Y, batch_sizes=(1, 8, 32)):
+    """Runs random inputs of each batch size through a model, so that the
+    memory allocation, kernel selection and graph optimization TensorFlow
+    does on first use don't slow down real requests.
+
+    # Arguments:
+        session (Session): TensorFlow session the model was loaded on.
+        X: the input tensor of the model, as returned by a model getter.
+        Y: the output tensor, or a list of tensors, to run.
+        batch_sizes: batch sizes to run, which should cover the sizes used
+                    in production.
+    """
+    _warmup(session, X, Y, batch_sizes)
+
+
+def _session_or_default(sess, session_options):
+    if sess is None:
+        sess = make_inference_session(**session_options)
+        _owned_sessions[sess.graph] = sess
+    return sess
+
+
+def _layer_tensor(graph, mod, name):
+    # graph tensor names contain an output index, Keras layer names do not
+    if ':' in name:
+        return graph.get_tensor_by_name(name)
+    names = [layer.name for layer in mod.layers]
+    if name not in names:
+        close = difflib.get_close_matches(name, names)
+        raise ValueError('{} has no layer named {!r}{}'.format(
+            mod.name, name,
+            ', did you mean {}?'.format(' or '.join(map(repr, close)))
+            if close else ''))
+    return mod.get_layer(name).get_output_at(0)
+
+
+def _pool_tensor(tensor, pooling):
+    # global pooling of 4D activations, shared between calls via its name
+    if pooling is None or tensor.shape.ndims != 4:
+        return tensor
+    if pooling not in ('avg', 'max'):
+        raise ValueError('Unknown pooling {!r}, expected "avg" or "max"'.format(
+            pooling))
+    name = 'include_pooling/{}_{}'.format(tensor.op.name.replace('/', '_'),
+                                          pooling)
+    try:
+        return tensor.graph.get_tensor_by_name(name + ':0')
+    except KeyError:
+        pass
+    with tensor.graph.as_default():
+        reduce = tf.reduce_mean if pooling == 'avg' else tf.reduce_max
+        return reduce(tensor, axis=[1, 2], name=name)
+
+
+def _get_model(sess, model_name, include_tensors, cache=True,
+               include_pooling=None, session_options={}, quantize=None,
+               warmup=None, tta=None, tta_reduce='mean', **kwargs):
+    # create a session tuned for inference if the user did not pass one
+    sess = _session_or_default(sess, session_options)
 
-    # get additional tensors from graph as requested by user
     tensors = []
-    sess = tf.keras.backend.get_session()
-    for name in include_tensors:
-        tensors.append(sess.graph.get_tensor_by_name(name))
+    if quantize is not None:
+        # quantized models are frozen in a private graph and imported as
+        # constants
+        if include_tensors:
+            raise ValueError('include_tensors is not supported for quantized '
+                             'models')
+        if tta:
+            raise ValueError('tta is not supported for quantized models')
+        key = _cache_key(sess, model_name, dict(kwargs, quantize=quantize)) \
+            if cache else None
+        with _graph_lock(sess.graph):
+            entry = _cache_lookup(key, sess) if key is not None else None
+            if entry is not None:
+                X, Y = entry.input, entry.output
+            else:
+                graph_def = freeze(model_name, quantize=quantize, **kwargs)
+                X, Y = load_frozen(sess, graph_def, name=model_name)
+                if key is not None:
+                    _cache_insert(key, _CacheEntry(weakref.ref(sess), None, X,
+                                                   Y, graph_def.ByteSize()))
+    else:
+        # get input tensor for feeddict needs and get output tensor
+        X, mod = _build_model(sess, model_name, cache, tta=tta, **kwargs)
+        Y = mod.get_output_at(0)
 
-    tf.keras.backend.set_session(old_sess)
+        # get additional tensors from graph as requested by user
+        for name in include_tensors:
+            tensor = _layer_tensor(sess.graph, mod, name)
+            tensors.append(_pool_tensor(tensor, include_pooling))
+
+        # the model ran on every view of each image, combine them per image
+        if tta:
+            Y = _tta_reduce(Y, tta, tta_reduce)
+            tensors = [_tta_reduce(tensor, tta, tta_reduce)
+                       for tensor in tensors]
+
+    if warmup:
+        _warmup(sess, X, [Y] + tensors, warmup)
     return (X, Y, *tensors)
 
 
-def DenseNet121(session, include_tensors=[], **kwargs):
+def DenseNet121(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#densenet for more information and
@@ -32,11 +755,66 @@ def DenseNet121(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#densenet. The standard are
                 consist of the following parameters, but certain models have
@@ -67,11 +845,10 @@ def DenseNet121(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.DenseNet121,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'DenseNet121', include_tensors, **kwargs)
 
 
-def DenseNet169(session, include_tensors=[], **kwargs):
+def DenseNet169(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#densenet for more information and
@@ -80,11 +857,66 @@ def DenseNet169(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#densenet. The standard are
                 consist of the following parameters, but certain models have
@@ -115,11 +947,10 @@ def DenseNet169(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.DenseNet169,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'DenseNet169', include_tensors, **kwargs)
 
 
-def DenseNet201(session, include_tensors=[], **kwargs):
+def DenseNet201(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#densenet for more information and
@@ -128,11 +959,66 @@ def DenseNet201(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#densenet. The standard are
                 consist of the following parameters, but certain models have
@@ -163,11 +1049,10 @@ def DenseNet201(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.DenseNet201,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'DenseNet201', include_tensors, **kwargs)
 
 
-def InceptionResNetV2(session, include_tensors=[], **kwargs):
+def InceptionResNetV2(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#inceptionresnetv2 for more information and
@@ -178,11 +1063,66 @@ def InceptionResNetV2(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#inceptionresnetv2. The standard
                 are consist of the following parameters, but certain models
@@ -213,11 +1153,10 @@ def InceptionResNetV2(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.InceptionResNetV2,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'InceptionResNetV2', include_tensors, **kwargs)
 
 
-def InceptionV3(session, include_tensors=[], **kwargs):
+def InceptionV3(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#inceptionv3 for more information and
@@ -228,11 +1167,66 @@ def InceptionV3(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#inceptionv3. The standard are
                 consist of the following parameters, but certain models have
@@ -263,11 +1257,10 @@ def InceptionV3(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.InceptionV3,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'InceptionV3', include_tensors, **kwargs)
 
 
-def MobileNet(session, include_tensors=[], **kwargs):
+def MobileNet(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#mobilenet for more information and
@@ -278,11 +1271,66 @@ def MobileNet(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#mobilenet. The standard are
                 consist of the following parameters, but certain models have
@@ -313,11 +1361,10 @@ def MobileNet(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.MobileNet,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'MobileNet', include_tensors, **kwargs)
 
 
-def NASNetLarge(session, include_tensors=[], **kwargs):
+def NASNetLarge(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#nasnet for more information and
@@ -328,11 +1375,66 @@ def NASNetLarge(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#nasnet. The standard are
                 consist of the following parameters, but certain models have
@@ -363,11 +1465,10 @@ def NASNetLarge(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.NASNetLarge,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'NASNetLarge', include_tensors, **kwargs)
 
 
-def NASNetMobile(session, include_tensors=[], **kwargs):
+def NASNetMobile(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#nasnet for more information and
@@ -378,11 +1479,66 @@ def NASNetMobile(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#nasnet. The standard are
                 consist of the following parameters, but certain models have
@@ -413,11 +1569,10 @@ def NASNetMobile(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.NASNetMobile,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'NASNetMobile', include_tensors, **kwargs)
 
 
-def ResNet50(session, include_tensors=[], **kwargs):
+def ResNet50(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#resnet50 for more information and
@@ -428,11 +1583,66 @@ def ResNet50(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#resnet50. The standard are
                 consist of the following parameters, but certain models have
@@ -463,11 +1673,10 @@ def ResNet50(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.ResNet50,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'ResNet50', include_tensors, **kwargs)
 
 
-def VGG16(session, include_tensors=[], **kwargs):
+def VGG16(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#vgg16 for more information and
@@ -478,11 +1687,66 @@ def VGG16(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#vgg16. The standard are
                 consist of the following parameters, but certain models have
@@ -513,11 +1777,10 @@ def VGG16(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.VGG16,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'VGG16', include_tensors, **kwargs)
 
 
-def VGG19(session, include_tensors=[], **kwargs):
+def VGG19(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#vgg19 for more information and
@@ -528,11 +1791,66 @@ def VGG19(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#vgg19. The standard are
                 consist of the following parameters, but certain models have
@@ -563,11 +1881,10 @@ def VGG19(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.VGG19,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'VGG19', include_tensors, **kwargs)
 
 
-def Xception(session, include_tensors=[], **kwargs):
+def Xception(session=None, include_tensors=[], **kwargs):
     """DenseNet pre-trained on ImageNet, returning the input and
     output tensors. Graph accessible via `sess.graph`. See
     https://tf.keras.io/applications/#xception for more information and
@@ -578,11 +1895,66 @@ def Xception(session, include_tensors=[], **kwargs):
     # Arguments:
         sess (Session): optional TensorFlow session to load the model and
                         weights on. If not passed, a new session will be
-                        created.
+                        created by `make_inference_session` and can be
+                        retrieved with `get_session(X)`.
+        session_options (dict): arguments to `make_inference_session` for
+                        the session created when none is passed, e.g.
+                        `{'profile': 'throughput', 'cores': 8}`.
         include_tensors: a convenience parameter to return additional tensors
                         from the graph in addition to the input and output
-                        layers. Can also be done by calling
+                        layers. Accepts Keras layer names such as `'mixed7'`,
+                        which return the layer's output, as well as graph
+                        tensor names such as `'mixed7/concat:0'`, which can
+                        also be fetched by calling
                         `sess.graph.get_tensor_by_name(name)`.
+        include_pooling: optional global pooling, `'avg'` or `'max'`, applied
+                        in the graph to 4D tensors requested through
+                        `include_tensors`.
+        cache (bool): whether to reuse a model already built on the same
+                        session with the same arguments rather than building
+                        it and loading its weights again. Defaults to `True`.
+                        See `model_cache_info` and `set_model_cache_limits`.
+        preprocess (bool): whether to prepend the model's preprocessing ops
+                        (see `preprocess_input`) to the graph, so that `X`
+                        accepts unprocessed RGB images. Defaults to `False`.
+        input_format (str): what `X` accepts. `'float'` (the default) takes
+                        float images of the model's input shape, `'uint8'`
+                        takes uint8 RGB images of any size and `'jpeg'` takes
+                        a batch of encoded JPEG, PNG or BMP strings. The last
+                        two are resized to `input_shape` and preprocessed in
+                        the graph.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`
+                        to reduce memory. The model is then frozen (see
+                        `freeze`) and imported into the session's graph
+                        without variables, and `include_tensors` is not
+                        supported. See `quantization_error` to check the
+                        effect on accuracy.
+        weight_store: directory of a `WeightStore` (or the store itself) to
+                        load ImageNet weights from instead of Keras' download
+                        cache. Defaults to the `TFMODELZOO_WEIGHTS`
+                        environment variable.
+        cut_at (str): optional name of a Keras layer, e.g. `'mixed7'`, to end
+                        the model at. Only the layers this layer depends on
+                        are created and loaded, and `Y` is its output. With a
+                        weight store only their weights are copied (though the
+                        whole file is checksummed once per process);
+                        otherwise the full weights are loaded once in a
+                        private graph that is freed afterwards.
+        warmup: batch sizes, e.g. `[1, 8, 32]`, of random inputs to run
+                        through the model before returning, so that the first
+                        real run isn't slowed down by TensorFlow's lazy
+                        initialization. `True` warms up with a single batch.
+        batch_size (int): optional static batch size of `X`, letting the
+                        graph optimizer specialize for it.
+        tta: optional test-time augmentation views, e.g. `('identity',
+                        'flip')` or `TEN_CROP`, see `TTA_VIEWS`. Each image
+                        fed to `X` is cropped and flipped into all views in
+                        the graph, the views are run as one batch and `Y`
+                        (and `include_tensors`) combine them per image.
+        tta_reduce (str): how views are combined, `'mean'` (the default) or
+                        `'max'`.
+        tta_crop (float): side of the center and corner crops relative to
+                        the image. Defaults to `0.875`.
         **kwargs: arguments to be passed to the tf.keras application. See
                 https://tf.keras.io/applications/#xception. The standard are
                 consist of the following parameters, but certain models have
@@ -613,5 +1985,2436 @@ def Xception(session, include_tensors=[], **kwargs):
         *tensors: any other tensors requested by the user via the
                 `include_tensors` parameter
     """
-    return _get_model(session, tf.keras.applications.Xception,
-                    include_tensors, **kwargs)
+    return _get_model(session, 'Xception', include_tensors, **kwargs)
+
+
+def Ensemble(session=None, models=('ResNet50', 'MobileNet'),
+             input_format='uint8', average=True, session_options={},
+             **kwargs):
+    """Several models sharing one input, built in a single graph so that one
+    `sess.run` serves the whole ensemble. Images are fed once, decoded once,
+    then resized and preprocessed in the graph for each model, whose ops are
+    created under a name scope of its own.
+
+    # Arguments:
+        session (Session): optional TensorFlow session to load the models
+                        on, created as for the model getters if not passed.
+        models: names of the models to include, or a dict mapping each name
+                        to extra arguments for that model only.
+        input_format (str): `'uint8'` (the default) or `'float'` for RGB
+                        images of any size with values in [0, 255], or
+                        `'jpeg'` for a batch of encoded image strings.
+        average (bool): whether to average the models' outputs in the graph,
+                        which requires outputs of the same shape.
+        session_options (dict): see the model getters.
+        **kwargs: arguments to be passed to every tf.keras application, as
+                for the model getters.
+
+    # Returns:
+        X: the shared input tensor
+        Y: the averaged output tensor, only if `average` is `True`
+        *outputs: the output tensor of each model, in order
+    """
+    if not isinstance(models, dict):
+        models = OrderedDict((name, {}) for name in models)
+    sess = _session_or_default(session, session_options)
+
+    with sess.graph.as_default():
+        if input_format == 'jpeg':
+            # decode once, at the largest input size among the models
+            size = max(_default_input_shape(name, dict(kwargs, **extra))[0]
+                       for name, extra in models.items())
+            X, images = _input_pipeline(None, 'jpeg', False, (size, size, 3))
+        elif input_format in ('uint8', 'float'):
+            X = tf.placeholder(tf.as_dtype(input_format), (None, None, None, 3),
+                               name='images')
+            images = tf.cast(X, tf.float32)
+        else:
+            raise ValueError('Unknown input_format {!r}, expected "float", '
+                             '"uint8" or "jpeg"'.format(input_format))
+
+        outputs = []
+        for name, extra in models.items():
+            model_kwargs = dict(kwargs, **extra)
+            shape = _default_input_shape(name, model_kwargs)
+            with tf.name_scope(name):
+                model_input = images
+                if None not in shape[:2]:
+                    model_input = tf.image.resize_images(images, shape[:2])
+                model_input = _preprocess_tensor(model_input,
+                                                 MODELS[name].preprocessing)
+                _, mod = _build_model(sess, name, cache=False,
+                                      input_tensor=model_input,
+                                      **model_kwargs)
+            outputs.append(mod.get_output_at(0))
+
+        if not average:
+            return (X, *outputs)
+        with tf.name_scope('ensemble'):
+            Y = tf.add_n(outputs) / float(len(outputs))
+    return (X, Y, *outputs)
+
+
+class WeightStore(object):
+    """A directory of model weights in a flat format that is memory-mapped
+    when loaded, indexed by a `manifest.json` holding the SHA256 checksum,
+    layout and variant of each model's weight file.
+
+    Loading copies the weights into the model's variables straight from the
+    mapped file, without parsing HDF5 or buffering another copy. Each process
+    still holds the weights in its own variables; only reading the file goes
+    through the shared page cache. A missing or corrupt file raises an error
+    instead of falling back to downloading the weights.
+
+    Getters use a store for `weights='imagenet'` when given its directory as
+    `weight_store`, or when the `TFMODELZOO_WEIGHTS` environment variable
+    points to one.
+
+    # Arguments:
+        root (str): directory of the store, created if needed.
+    """
+
+    MANIFEST = 'manifest.json'
+    ALIGNMENT = 64
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._verified = set()
+        self._lock = threading.Lock()
+
+    def _manifest(self):
+        path = os.path.join(self.root, self.MANIFEST)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        path = os.path.join(self.root, self.MANIFEST)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    def models(self):
+        """Returns the names of the models in the store."""
+        return sorted(self._manifest())
+
+    def add(self, model_name, weights='imagenet', include_top=True):
+        """Converts a model's weights into the store. Requires the weights to
+        be available to Keras, i.e. downloadable or already cached, unless a
+        local HDF5 file is given.
+
+        # Arguments:
+            model_name (str): name of the model, e.g. `'ResNet50'`.
+            weights: `'imagenet'` or the path to a Keras HDF5 weights file.
+            include_top (bool): whether the weights include the fully
+                        connected layers. Weights stored with the top can also
+                        be loaded into models built without it.
+        """
+        graph = tf.Graph()
+        with graph.as_default(), tf.Session(graph=graph) as sess, \
+                sess.as_default():
+            mod = _application(model_name)(weights=weights,
+                                            include_top=include_top)
+            layers = [(layer.name, tf.keras.backend.batch_get_value(
+                layer.weights)) for layer in mod.layers if layer.weights]
+
+        os.makedirs(self.root, exist_ok=True)
+        filename = '{}.bin'.format(model_name)
+        path = os.path.join(self.root, filename)
+        index, offset, digest = [], 0, hashlib.sha256()
+        with open(path + '.tmp', 'wb') as f:
+            for layer_name, values in layers:
+                for i, value in enumerate(values):
+                    padding = -offset % self.ALIGNMENT
+                    data = b'\0' * padding + np.ascontiguousarray(value).tobytes()
+                    f.write(data)
+                    digest.update(data)
+                    offset += padding
+                    index.append({'layer': layer_name, 'index': i,
+                                  'shape': list(value.shape),
+                                  'dtype': value.dtype.str, 'offset': offset})
+                    offset += value.nbytes
+        os.replace(path + '.tmp', path)
+
+        with self._lock:
+            manifest = self._manifest()
+            manifest[model_name] = {'file': filename,
+                                    'sha256': digest.hexdigest(),
+                                    'size': offset, 'include_top': include_top,
+                                    'weights': index}
+            self._write_manifest(manifest)
+
+    def verify(self, model_name):
+        """Checks the weight file of a model against its manifest entry,
+        raising `IOError` if it is missing or corrupt."""
+        entry = self._manifest().get(model_name)
+        if entry is None:
+            raise IOError('No weights for {} in weight store {}'.format(
+                model_name, self.root))
+        path = os.path.join(self.root, entry['file'])
+        if not os.path.exists(path) or os.path.getsize(path) != entry['size']:
+            raise IOError('Weight file {} is missing or truncated'.format(path))
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime)
+        if key in self._verified:
+            return entry
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        if digest.hexdigest() != entry['sha256']:
+            raise IOError('Checksum mismatch for weight file {}'.format(path))
+        self._verified.add(key)
+        return entry
+
+    def load(self, model_name, verify=True):
+        """Maps a model's weight file into memory.
+
+        # Returns:
+            An ordered dict mapping each layer name, in the order of the
+            model's layers, to the list of its weights, as read-only arrays
+            backed by the mapped file.
+        """
+        entry = self.verify(model_name) if verify else \
+            self._manifest()[model_name]
+        data = np.memmap(os.path.join(self.root, entry['file']),
+                         dtype=np.uint8, mode='r')
+        layers = OrderedDict()
+        for weight in entry['weights']:
+            dtype = np.dtype(weight['dtype'])
+            nbytes = int(np.prod(weight['shape'])) * dtype.itemsize
+            start = weight['offset']
+            value = data[start:start + nbytes].view(dtype).reshape(
+                weight['shape'])
+            layers.setdefault(weight['layer'], []).append(value)
+        return layers
+
+    def assign(self, mod, model_name, verify=True):
+        """Loads a model's weights from the store into a built Keras model.
+        Like Keras' HDF5 loading, weights are matched by the order of the
+        layers that have them rather than by layer name, since auto-numbered
+        names such as `conv2d_3` shift when another model was built in the
+        same graph first. Must run with the model's session as the Keras
+        session."""
+        stored = list(self.load(model_name, verify).items())
+        weighted = [layer for layer in mod.layers if layer.weights]
+        if len(weighted) > len(stored):
+            raise IOError('Weight store {} has weights for {} layers of {}, '
+                          'the model has {}'.format(self.root, len(stored),
+                                                    model_name, len(weighted)))
+        # a model without the top only lacks the trailing layers
+        pairs = []
+        for layer, (stored_name, values) in zip(weighted, stored):
+            if [tuple(v.shape) for v in values] != \
+                    [tuple(w.shape.as_list()) for w in layer.weights]:
+                raise ValueError('Stored weights of layer {} of {} do not '
+                                 'match layer {} of the model'.format(
+                                     stored_name, model_name, layer.name))
+            pairs.extend(zip(layer.weights, values))
+        tf.keras.backend.batch_set_value(pairs)
+
+
+# stores opened from a directory, kept so their checksums are verified once
+_weight_stores = {}
+_weight_stores_lock = threading.Lock()
+
+
+def _weight_store(weight_store):
+    # resolve the getter argument or the environment default to a store
+    if weight_store is None:
+        weight_store = os.environ.get('TFMODELZOO_WEIGHTS')
+    if weight_store is None or isinstance(weight_store, WeightStore):
+        return weight_store
+    root = os.path.abspath(weight_store)
+    with _weight_stores_lock:
+        if root not in _weight_stores:
+            _weight_stores[root] = WeightStore(root)
+        return _weight_stores[root]
+
+
+# node names given to the input and output of frozen graphs
+FROZEN_INPUT = 'input'
+FROZEN_OUTPUT = 'output'
+
+
+def _application(model_name):
+    if model_name not in MODELS:
+        raise ValueError('Unknown model {!r}, expected one of: {}'.format(
+            model_name, ', '.join(MODELS)))
+    return getattr(tf.keras.applications, model_name)
+
+
+def _rename_node(graph_def, old, new):
+    # rename a node and every reference to it, including control inputs
+    for node in graph_def.node:
+        if node.name == old:
+            node.name = new
+        for i, name in enumerate(node.input):
+            prefix = '^' if name.startswith('^') else ''
+            base, sep, port = name.lstrip('^').partition(':')
+            if base == old:
+                node.input[i] = prefix + new + sep + port
+
+
+def _name_frozen_io(graph_def, x_name, y_name):
+    _rename_node(graph_def, x_name, FROZEN_INPUT)
+    output = graph_def.node.add()
+    output.op = 'Identity'
+    output.name = FROZEN_OUTPUT
+    output.input.append(y_name)
+    output.attr['T'].type = tf.float32.as_datatype_enum
+
+
+def freeze(model_name, path=None, quantize=None, optimize=False, **kwargs):
+    """Builds a model for inference only and serializes it as a single GraphDef
+    with its weights folded into constants. The model is built in a private
+    graph with the learning phase fixed to inference, so dropout and batch
+    normalization training branches are never created, and identity chains
+    are removed before the remaining constant subgraphs are folded.
+
+    # Arguments:
+        model_name (str): name of the model, e.g. `'ResNet50'`.
+        path (str): optional file to write the serialized GraphDef to.
+        quantize (str): optionally store the weights as `'fp16'` or `'int8'`,
+                see `quantize_graph_def`.
+        optimize (bool): whether to fold batch normalization into the
+                convolutions before quantizing, see `optimize_graph_def`.
+        **kwargs: arguments to be passed to the tf.keras application, as for
+                the model getters.
+
+    # Returns:
+        The frozen `GraphDef`, whose input and output nodes are named
+        `FROZEN_INPUT` and `FROZEN_OUTPUT`. See `load_frozen`.
+    """
+    from tensorflow.tools.graph_transforms import TransformGraph
+
+    graph = tf.Graph()
+    with graph.as_default():
+        # tf.keras tracks the learning phase per graph
+        tf.keras.backend.set_learning_phase(0)
+        sess = tf.Session(graph=graph)
+        try:
+            X, mod = _build_model(sess, model_name, cache=False, **kwargs)
+            x_name = X.op.name
+            y_name = mod.get_output_at(0).op.name
+            graph_def = tf.graph_util.convert_variables_to_constants(
+                sess, graph.as_graph_def(), [y_name])
+        finally:
+            sess.close()
+
+    graph_def = tf.graph_util.remove_training_nodes(
+        graph_def, protected_nodes=[x_name, y_name])
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, [y_name])
+    graph_def = TransformGraph(graph_def, [x_name], [y_name],
+                               ['fold_constants(ignore_errors=true)',
+                                'sort_by_execution_order'])
+    if optimize:
+        graph_def = optimize_graph_def(graph_def, x_name, y_name)
+    if quantize is not None:
+        graph_def = quantize_graph_def(graph_def, quantize)
+    _name_frozen_io(graph_def, x_name, y_name)
+
+    if path is not None:
+        with open(path, 'wb') as f:
+            f.write(graph_def.SerializeToString())
+    return graph_def
+
+
+def load_frozen(session, path, name=None):
+    """Imports a graph written by `freeze` into the session's graph. No
+    variables are created, so the model is ready to run as soon as this
+    returns.
+
+    # Arguments:
+        session (Session): TensorFlow session to load the model on.
+        path: path of the serialized GraphDef, or a `GraphDef` instance.
+        name (str): optional name scope to import the graph under, defaulting
+                    to TensorFlow's `'import'`.
+
+    # Returns:
+        X: the input tensor of the graph
+        Y: the output tensor of the graph
+    """
+    if isinstance(path, tf.GraphDef):
+        graph_def = path
+    else:
+        graph_def = tf.GraphDef()
+        with open(path, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+
+    with session.graph.as_default():
+        X, Y = tf.import_graph_def(
+            graph_def, name=name,
+            return_elements=[FROZEN_INPUT + ':0', FROZEN_OUTPUT + ':0'])
+    return X, Y
+
+
+def _const_node(graph_def, name, array):
+    node = graph_def.node.add()
+    node.op = 'Const'
+    node.name = name
+    node.attr['dtype'].type = tf.as_dtype(array.dtype).as_datatype_enum
+    node.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(array))
+    return node
+
+
+def quantize_graph_def(graph_def, mode, min_elements=1024):
+    """Stores the float32 weights of a frozen graph at lower precision, adding
+    ops that restore float32 values when the graph runs.
+
+    With `'fp16'` each weight is stored as float16 and cast back. With
+    `'int8'` each weight is stored as int8 with one float32 scale per output
+    channel (its last axis, or last two for depthwise kernels), and
+    dequantized by a cast and a multiplication.
+    TensorFlow's graph optimizer may fold small dequantized weights back into
+    float32 constants when the graph is loaded, but it leaves tensors larger
+    than 10MB, which dominate the memory of models such as VGG, quantized.
+
+    # Arguments:
+        graph_def (GraphDef): a frozen graph, e.g. from `freeze`.
+        mode (str): `'fp16'` or `'int8'`.
+        min_elements (int): float32 constants with fewer elements are left
+                    untouched, as are vectors such as biases and batch
+                    normalization parameters.
+
+    # Returns:
+        A new `GraphDef`.
+    """
+    if mode not in ('fp16', 'int8'):
+        raise ValueError('Unknown quantization {!r}, expected "fp16" or '
+                         '"int8"'.format(mode))
+    # depthwise kernels (height, width, channels, multiplier) have an output
+    # channel per entry of their last two axes
+    depthwise = {_node_name(node.input[1]) for node in graph_def.node
+                 if node.op == 'DepthwiseConv2dNative'}
+    quantized = tf.GraphDef()
+    quantized.versions.CopyFrom(graph_def.versions)
+    quantized.library.CopyFrom(graph_def.library)
+    for node in graph_def.node:
+        if node.op != 'Const' or \
+                node.attr['dtype'].type != tf.float32.as_datatype_enum:
+            quantized.node.add().CopyFrom(node)
+            continue
+        weights = tf.make_ndarray(node.attr['value'].tensor)
+        # a float32 scale per element of a vector would outweigh its floats
+        if weights.size < min_elements or weights.ndim < 2:
+            quantized.node.add().CopyFrom(node)
+            continue
+
+        # the node keeps its name, so consumers read the restored weights
+        if mode == 'fp16':
+            stored = _const_node(quantized, node.name + '/fp16',
+                                 weights.astype(np.float16))
+            restored = quantized.node.add()
+            restored.op = 'Cast'
+            restored.name = node.name
+            restored.input.append(stored.name)
+            restored.attr['SrcT'].type = tf.float16.as_datatype_enum
+            restored.attr['DstT'].type = tf.float32.as_datatype_enum
+        else:
+            axes = (0, 1) if node.name in depthwise else \
+                tuple(range(weights.ndim - 1))
+            scale = np.abs(weights).max(axis=axes) / 127.
+            scale[scale == 0] = 1.
+            stored = _const_node(
+                quantized, node.name + '/int8',
+                np.round(weights / scale).astype(np.int8))
+            scale = _const_node(quantized, node.name + '/scale',
+                                scale.astype(np.float32))
+            cast = quantized.node.add()
+            cast.op = 'Cast'
+            cast.name = node.name + '/dequantize'
+            cast.input.append(stored.name)
+            cast.attr['SrcT'].type = tf.int8.as_datatype_enum
+            cast.attr['DstT'].type = tf.float32.as_datatype_enum
+            restored = quantized.node.add()
+            restored.op = 'Mul'
+            restored.name = node.name
+            restored.input.extend([cast.name, scale.name])
+            restored.attr['T'].type = tf.float32.as_datatype_enum
+    return quantized
+
+
+def quantization_error(model_name, images, quantize='int8', **kwargs):
+    """Compares a model's outputs with and without weight quantization on a
+    small calibration set of images.
+
+    # Arguments:
+        model_name (str): name of the model, e.g. `'ResNet50'`.
+        images: a batch of images, as fed to `X` for the given `kwargs`.
+        quantize (str): `'fp16'` or `'int8'`.
+        **kwargs: arguments to be passed to the tf.keras application, as for
+                the model getters.
+
+    # Returns:
+        A dict with the `max_abs_error` and `mean_abs_error` between the
+        outputs, the fraction of images whose top-1 class agrees
+        (`top1_agreement`, for 2D outputs), and the serialized size in bytes
+        of the float and quantized graphs.
+    """
+    outputs, sizes = [], []
+    for mode in (None, quantize):
+        graph_def = freeze(model_name, quantize=mode, **kwargs)
+        sizes.append(graph_def.ByteSize())
+        with tf.Session(graph=tf.Graph()) as sess:
+            X, Y = load_frozen(sess, graph_def)
+            outputs.append(sess.run(Y, {X: images}))
+
+    error = np.abs(outputs[0] - outputs[1])
+    result = {'max_abs_error': float(error.max()),
+              'mean_abs_error': float(error.mean()),
+              'float_bytes': sizes[0], 'quantized_bytes': sizes[1]}
+    if outputs[0].ndim == 2:
+        result['top1_agreement'] = float(np.mean(
+            outputs[0].argmax(axis=1) == outputs[1].argmax(axis=1)))
+    return result
+
+
+def _node_name(name):
+    # the node an input refers to, without control marker or output index
+    return name.lstrip('^').partition(':')[0]
+
+
+def _output_index(name):
+    return int(name.partition(':')[2] or 0)
+
+
+def _topological_order(graph_def):
+    # nodes after their inputs. Edges from NextIteration are skipped, which
+    # breaks the cycles of while loops such as those created by map_fn
+    nodes = OrderedDict((node.name, node) for node in graph_def.node)
+    pending, consumers = {}, {}
+    for node in graph_def.node:
+        inputs = {_node_name(name) for name in node.input
+                  if _node_name(name) in nodes and
+                  nodes[_node_name(name)].op != 'NextIteration'}
+        pending[node.name] = len(inputs)
+        for name in inputs:
+            consumers.setdefault(name, []).append(node.name)
+    ready = deque(name for name, count in pending.items() if not count)
+    order = []
+    while ready:
+        name = ready.popleft()
+        order.append(nodes[name])
+        for consumer in consumers.get(name, []):
+            pending[consumer] -= 1
+            if not pending[consumer]:
+                ready.append(consumer)
+    return order
+
+
+def _prune_learning_phase(graph_def):
+    """Fixes the Keras learning phase to inference and removes the training
+    branches of the `tf.cond`s switching on it, as the TensorFlow executor
+    would at run time: the untaken output of each `Switch` is dead, deadness
+    spreads to the nodes using it and a `Merge` forwards its one live input.
+    """
+    false = tf.make_tensor_proto(False)
+    values, dead, dead_outputs = {}, set(), {}
+
+    def is_dead(name):
+        if name.startswith('^'):
+            return _node_name(name) in dead
+        return _node_name(name) in dead or \
+            dead_outputs.get(_node_name(name)) == _output_index(name)
+
+    for node in _topological_order(graph_def):
+        data = [name for name in node.input if not name.startswith('^')]
+        if node.op == 'Merge':
+            if data and all(map(is_dead, data)):
+                dead.add(node.name)
+            continue
+        if any(map(is_dead, node.input)):
+            dead.add(node.name)
+            continue
+        if node.op == 'PlaceholderWithDefault' and \
+                node.name.split('/')[-1].startswith('keras_learning_phase'):
+            node.op = 'Const'
+            del node.input[:]
+            for key in list(node.attr):
+                del node.attr[key]
+            node.attr['dtype'].type = tf.bool.as_datatype_enum
+            node.attr['value'].tensor.CopyFrom(false)
+            values[node.name] = False
+        elif node.op == 'Const' and \
+                node.attr['dtype'].type == tf.bool.as_datatype_enum and \
+                not node.attr['value'].tensor.tensor_shape.dim:
+            values[node.name] = bool(tf.make_ndarray(node.attr['value'].tensor))
+        elif node.op == 'Identity' and _node_name(data[0]) in values:
+            values[node.name] = values[_node_name(data[0])]
+        elif node.op == 'Switch' and _node_name(data[1]) in values:
+            # output 0 is taken when the predicate is false, output 1 when true
+            dead_outputs[node.name] = 0 if values[_node_name(data[1])] else 1
+
+    # bypass the resolved switches and merges, then drop the dead nodes
+    replacements = {}
+    for node in graph_def.node:
+        if node.name in dead_outputs and node.name not in dead:
+            replacements[node.name] = node.input[0]
+        elif node.op == 'Merge' and node.name not in dead:
+            data = [name for name in node.input if not name.startswith('^')]
+            live = [name for name in data if not is_dead(name)]
+            if len(live) == 1 < len(data):
+                replacements[node.name] = live[0]
+    pruned = tf.GraphDef()
+    pruned.versions.CopyFrom(graph_def.versions)
+    pruned.library.CopyFrom(graph_def.library)
+    for node in graph_def.node:
+        if node.name in dead or node.name in replacements:
+            continue
+        inputs = []
+        for name in node.input:
+            if is_dead(name):
+                continue
+            while _node_name(name) in replacements:
+                replacement = replacements[_node_name(name)]
+                name = ('^' + _node_name(replacement)) \
+                    if name.startswith('^') else replacement
+            inputs.append(name)
+        copy = pruned.node.add()
+        copy.CopyFrom(node)
+        del copy.input[:]
+        copy.input.extend(inputs)
+    return pruned
+
+
+def _fold_batch_norms(graph_def):
+    """Folds inference-mode `FusedBatchNorm` ops into the weights of the
+    `Conv2D` or `DepthwiseConv2dNative` op (and its bias, if any) feeding
+    them. Each folded batch normalization becomes a `BiasAdd` of the same
+    name."""
+    nodes = {node.name: node for node in graph_def.node}
+    uses = {}
+    for node in graph_def.node:
+        for name in node.input:
+            uses.setdefault(_node_name(name), []).append(name)
+
+    def constant(name):
+        node = nodes.get(_node_name(name))
+        if node is None or node.op != 'Const':
+            return None
+        return tf.make_ndarray(node.attr['value'].tensor)
+
+    def only_use(name, port=0):
+        return [_output_index(use) for use in uses.get(name, [])] == [port]
+
+    removed = set()
+    for node in list(graph_def.node):
+        if node.op not in ('FusedBatchNorm', 'FusedBatchNormV2',
+                           'FusedBatchNormV3') or \
+                node.attr['is_training'].b or \
+                node.attr['data_format'].s not in (b'', b'NHWC') or \
+                any(_output_index(use) for use in uses.get(node.name, [])):
+            continue
+        source = nodes.get(_node_name(node.input[0]))
+        bias = None
+        if source is not None and source.op == 'BiasAdd':
+            bias = constant(source.input[1])
+            if bias is None or not only_use(source.name):
+                continue
+            bias_add, source = source, nodes.get(_node_name(source.input[0]))
+        if source is None or \
+                source.op not in ('Conv2D', 'DepthwiseConv2dNative') or \
+                source.attr['data_format'].s not in (b'', b'NHWC') or \
+                not only_use(source.name):
+            continue
+        weights = constant(source.input[1])
+        gamma, beta, mean, variance = map(constant, node.input[1:5])
+        if weights is None or any(value is None for value in
+                                  (gamma, beta, mean, variance)):
+            continue
+
+        scale = gamma / np.sqrt(variance + node.attr['epsilon'].f)
+        shift = beta - mean * scale
+        if bias is not None:
+            shift += bias * scale
+            removed.add(bias_add.name)
+        if source.op == 'DepthwiseConv2dNative':
+            scale = scale.reshape(weights.shape[2:])
+        weights = _const_node(graph_def, source.name + '/folded_weights',
+                              (weights * scale).astype(np.float32))
+        shift = _const_node(graph_def, node.name + '/folded_bias',
+                            shift.astype(np.float32))
+        source.input[1] = weights.name
+
+        node.op = 'BiasAdd'
+        del node.input[:]
+        node.input.extend([source.name, shift.name])
+        for key in list(node.attr):
+            del node.attr[key]
+        node.attr['T'].type = tf.float32.as_datatype_enum
+        node.attr['data_format'].s = b'NHWC'
+
+    if removed:
+        nodes = [node for node in graph_def.node if node.name not in removed]
+        del graph_def.node[:]
+        graph_def.node.extend(nodes)
+    return graph_def
+
+
+def _registered_op(op_type):
+    from tensorflow.python.framework import op_def_registry
+
+    if hasattr(op_def_registry, 'get'):
+        return op_def_registry.get(op_type)
+    return op_def_registry.get_registered_ops().get(op_type)
+
+
+def _fuse_conv_activations(graph_def):
+    """Replaces each `Conv2D` -> `BiasAdd` -> `Relu` chain by a single
+    `_FusedConv2D` op named after the `Relu`, if this TensorFlow build
+    registers that op."""
+    op_def = _registered_op('_FusedConv2D')
+    if op_def is None:
+        return graph_def
+    attrs = {attr.name for attr in op_def.attr}
+    nodes = {node.name: node for node in graph_def.node}
+    uses = {}
+    for node in graph_def.node:
+        for name in node.input:
+            uses.setdefault(_node_name(name), []).append(name)
+
+    def only_use(name):
+        return [_output_index(use) for use in uses.get(name, [])] == [0]
+
+    removed = set()
+    for node in graph_def.node:
+        bias = nodes.get(_node_name(node.input[0])) if node.op == 'Relu' \
+            else None
+        if bias is None or bias.op != 'BiasAdd' or not only_use(bias.name):
+            continue
+        conv = nodes.get(_node_name(bias.input[0]))
+        if conv is None or conv.op != 'Conv2D' or \
+                conv.attr['data_format'].s not in (b'', b'NHWC') or \
+                not only_use(conv.name):
+            continue
+        node.op = '_FusedConv2D'
+        del node.input[:]
+        node.input.extend([conv.input[0], conv.input[1], bias.input[1]])
+        for key in list(node.attr):
+            del node.attr[key]
+        for key, value in conv.attr.items():
+            if key in attrs:
+                node.attr[key].CopyFrom(value)
+        node.attr['num_args'].i = 1
+        node.attr['fused_ops'].list.s.extend([b'BiasAdd', b'Relu'])
+        removed.update([bias.name, conv.name])
+
+    if removed:
+        nodes = [node for node in graph_def.node if node.name not in removed]
+        del graph_def.node[:]
+        graph_def.node.extend(nodes)
+    return graph_def
+
+
+def optimize_graph_def(graph_def, input_name, output_name,
+                       fuse_activations=True):
+    """Rewrites a frozen graph for faster CPU inference.
+
+    The Keras learning phase is fixed to inference and the training branches
+    switching on it are removed, batch normalizations are folded into the
+    weights and biases of the convolutions before them, and, where this
+    TensorFlow build has the `_FusedConv2D` op, convolutions are fused with
+    their bias and ReLU. See `optimization_error` to check the result.
+
+    # Arguments:
+        graph_def (GraphDef): a graph with its weights folded into constants.
+        input_name (str): name of the input node, which is kept.
+        output_name (str): name of the output node.
+        fuse_activations (bool): whether to fuse convolutions with their bias
+                    and ReLU.
+
+    # Returns:
+        A new `GraphDef`.
+    """
+    from tensorflow.tools.graph_transforms import TransformGraph
+
+    graph_def = _prune_learning_phase(graph_def)
+    graph_def = tf.graph_util.remove_training_nodes(
+        graph_def, protected_nodes=[input_name, output_name])
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, [output_name])
+    # folds the unfused form of batch normalization, a multiplication and
+    # addition after the convolution, once the constants are folded
+    graph_def = TransformGraph(graph_def, [input_name], [output_name],
+                               ['fold_constants(ignore_errors=true)',
+                                'fold_batch_norms'])
+    graph_def = _fold_batch_norms(graph_def)
+    if fuse_activations:
+        graph_def = _fuse_conv_activations(graph_def)
+    return tf.graph_util.extract_sub_graph(graph_def, [output_name])
+
+
+def optimize_for_inference(session, X, Y, path=None, fuse_activations=True):
+    """Freezes a model returned by a getter and optimizes it for inference,
+    see `optimize_graph_def`.
+
+    # Arguments:
+        session (Session): TensorFlow session the model was loaded on.
+        X: the input tensor of the model, as returned by a model getter.
+        Y: the output tensor to keep.
+        path (str): optional file to write the serialized GraphDef to.
+        fuse_activations (bool): see `optimize_graph_def`.
+
+    # Returns:
+        The optimized `GraphDef`, whose input and output nodes are named
+        `FROZEN_INPUT` and `FROZEN_OUTPUT`. See `load_frozen`.
+    """
+    x_name, y_name = X.op.name, Y.op.name
+    graph_def = tf.graph_util.convert_variables_to_constants(
+        session, session.graph.as_graph_def(), [y_name])
+    graph_def = optimize_graph_def(graph_def, x_name, y_name,
+                                   fuse_activations)
+    _name_frozen_io(graph_def, x_name, y_name)
+
+    if path is not None:
+        with open(path, 'wb') as f:
+            f.write(graph_def.SerializeToString())
+    return graph_def
+
+
+def optimization_error(session, X, Y, images, fuse_activations=True):
+    """Checks that `optimize_for_inference` preserves a model's outputs, by
+    running a batch of images through the model and its optimized graph.
+
+    # Arguments:
+        session (Session): TensorFlow session the model was loaded on.
+        X: the input tensor of the model, as returned by a model getter.
+        Y: the output tensor to compare.
+        images: a batch of inputs, as fed to `X`.
+        fuse_activations (bool): see `optimize_graph_def`.
+
+    # Returns:
+        A dict with the `max_abs_error` and `mean_abs_error` between the
+        outputs, the fraction of images whose top-1 class agrees
+        (`top1_agreement`, for 2D outputs), and the number of nodes computing
+        the output before and after optimization.
+    """
+    graph_def = optimize_for_inference(session, X, Y,
+                                       fuse_activations=fuse_activations)
+    reference = session.run(Y, {X: images})
+    with tf.Session(graph=tf.Graph()) as sess:
+        X_optimized, Y_optimized = load_frozen(sess, graph_def)
+        optimized = sess.run(Y_optimized, {X_optimized: images})
+
+    error = np.abs(reference - optimized)
+    result = {'max_abs_error': float(error.max()),
+              'mean_abs_error': float(error.mean()),
+              'nodes_before': len(tf.graph_util.extract_sub_graph(
+                  session.graph.as_graph_def(), [Y.op.name]).node),
+              'nodes_after': len(graph_def.node)}
+    if reference.ndim == 2:
+        result['top1_agreement'] = float(np.mean(
+            reference.argmax(axis=1) == optimized.argmax(axis=1)))
+    return result
+
+
+def load_models(models, workers=None, **kwargs):
+    """Loads several models in parallel threads, each in a session and graph
+    of its own created as by the model getters, e.g. to cut the cold start of
+    a service hosting several models.
+
+    # Arguments:
+        models: names of the models to load, or a dict mapping each name to
+                    extra arguments for that model only.
+        workers (int): number of models loaded at once, defaulting to all.
+        **kwargs: arguments to be passed to every getter. Unless a `warmup`
+                argument is given, each model is warmed up with a batch of one.
+
+    # Returns:
+        An `OrderedDict` mapping each model name to a `(session, X, Y)` tuple.
+    """
+    if not isinstance(models, dict):
+        models = OrderedDict((name, {}) for name in models)
+    kwargs.setdefault('warmup', True)
+
+    def load(name):
+        X, Y = _get_model(None, name, [],
+                          **dict(kwargs, **models[name]))
+        return get_session(X), X, Y
+
+    with ThreadPoolExecutor(workers or len(models)) as executor:
+        loaded = list(executor.map(load, models))
+    return OrderedDict(zip(models, loaded))
+
+
+class PredictionCache(object):
+    """Caches model outputs by the content of their inputs, so that duplicate
+    inputs, such as re-uploads of the same image, skip the forward pass.
+
+    Entries are keyed by a namespace identifying the model and its arguments
+    (see `namespace`) and a BLAKE2 hash of the raw input bytes. They are kept
+    in an in-process least-recently-used tier of at most `max_bytes`, and,
+    if a `path` is given, in a SQLite database that every process opening the
+    same path shares. Cached outputs are read-only arrays. The shared tier
+    is accessed under a lock of its own, so lookups that only need the
+    in-process tier never wait for the database, and database errors, such as
+    a database kept busy by other processes, count as misses.
+
+    # Arguments:
+        max_bytes (int): size budget of the in-process tier.
+        path (str): optional SQLite database file for the shared tier, which
+                    is never evicted from.
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20, path=None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.nbytes = 0
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        if path is not None:
+            import sqlite3
+
+            self._db_error = sqlite3.Error
+            self._db = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                       check_same_thread=False)
+            # lets readers in other processes proceed during writes
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS predictions (key BLOB '
+                             'PRIMARY KEY, dtype TEXT, shape TEXT, value BLOB)')
+
+    @staticmethod
+    def namespace(model, **kwargs):
+        """Returns the namespace of a model loaded with the given arguments,
+        e.g. `PredictionCache.namespace('ResNet50', input_format='jpeg')`.
+        It is the same in every process, so arguments must be JSON values,
+        or a `WeightStore`, which is identified by its directory."""
+        def normalize(value):
+            if isinstance(value, WeightStore):
+                return value.root
+            raise ValueError('Cannot derive a cache namespace from {!r}, pass '
+                             'a cache_namespace instead'.format(value))
+
+        return json.dumps([model, kwargs], sort_keys=True, default=normalize)
+
+    def key(self, namespace, x):
+        """Returns the cache key of a single input (without a batch
+        dimension), either an array or encoded image bytes."""
+        digest = hashlib.blake2b(namespace.encode('utf-8'), digest_size=16)
+        if isinstance(x, bytes):
+            digest.update(b'bytes')
+            digest.update(x)
+        else:
+            x = np.ascontiguousarray(x)
+            digest.update('{}{}'.format(x.dtype.str, x.shape).encode('ascii'))
+            digest.update(x.data)
+        return digest.digest()
+
+    def _insert(self, key, output):
+        if key not in self._entries:
+            self.nbytes += output.nbytes
+        self._entries[key] = output
+        self._entries.move_to_end(key)
+        while self.nbytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.stats['evictions'] += 1
+
+    def get(self, key, disk=True):
+        """Returns the cached output for a key, or `None`. With `disk=False`
+        only the in-process tier is looked up and a miss is not counted, for
+        callers that look up the shared tier later from another thread."""
+        with self._lock:
+            output = self._entries.get(key)
+            if output is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return output
+            if not disk:
+                return None
+        row = None
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    row = self._db.execute('SELECT dtype, shape, value FROM '
+                                           'predictions WHERE key = ?',
+                                           (key,)).fetchone()
+            except self._db_error:
+                pass
+        with self._lock:
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            output = np.frombuffer(row[2], row[0]).reshape(json.loads(row[1]))
+            self._insert(key, output)
+            self.stats['disk_hits'] += 1
+            return output
+
+    def put(self, key, output):
+        """Caches an output, returning the read-only copy that was cached."""
+        output = np.array(output)
+        output.setflags(write=False)
+        with self._lock:
+            self._insert(key, output)
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    self._db.execute('INSERT OR REPLACE INTO predictions '
+                                     'VALUES (?, ?, ?, ?)',
+                                     (key, output.dtype.str,
+                                      json.dumps(output.shape),
+                                      output.tobytes()))
+            except self._db_error:
+                pass
+        return output
+
+    def run(self, session, X, Y, inputs, namespace):
+        """Runs a batch of inputs through a model, sending only the inputs
+        whose output is not cached (each distinct input once) to
+        `session.run`.
+
+        # Arguments:
+            session (Session): TensorFlow session the model was loaded on.
+            X: the input tensor of the model, as returned by a model getter.
+            Y: the output tensor of the model, as returned by a model getter.
+            inputs: sequence of single inputs.
+            namespace (str): namespace of the model, see `namespace`.
+
+        # Returns:
+            The outputs, stacked into a batch.
+        """
+        keys = [self.key(namespace, x) for x in inputs]
+        outputs = [self.get(key) for key in keys]
+        misses = OrderedDict()
+        for i, (key, output) in enumerate(zip(keys, outputs)):
+            if output is None:
+                misses.setdefault(key, []).append(i)
+        if misses:
+            batch = [inputs[indices[0]] for indices in misses.values()]
+            batch = np.array(batch, dtype=object) \
+                if isinstance(batch[0], bytes) else np.stack(batch)
+            for (key, indices), output in zip(misses.items(),
+                                              session.run(Y, {X: batch})):
+                output = self.put(key, output)
+                for i in indices:
+                    outputs[i] = output
+        return np.stack(outputs)
+
+    def info(self):
+        """Returns the `hits`, `disk_hits`, `misses` and `evictions` counters,
+        the `hit_rate`, and the number of `entries` and `bytes` held in
+        memory."""
+        with self._lock:
+            info = dict(self.stats)
+            info['entries'] = len(self._entries)
+            info['bytes'] = self.nbytes
+        lookups = info['hits'] + info['disk_hits'] + info['misses']
+        info['hit_rate'] = (info['hits'] + info['disk_hits']) / lookups \
+            if lookups else 0.
+        return info
+
+    def clear(self):
+        """Empties the in-process tier and resets the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            for name in self.stats:
+                self.stats[name] = 0
+
+
+class Predictor(object):
+    """Runs a model on single inputs submitted from any number of threads.
+    Pending inputs are coalesced into batches of up to `max_batch_size`,
+    waiting at most `timeout` seconds for a batch to fill, so that one
+    `sess.run` serves many callers. Results are delivered through futures.
+
+    # Arguments:
+        session (Session): TensorFlow session the model was loaded on.
+        X: the input tensor of the model, as returned by a model getter.
+        Y: the output tensor of the model, as returned by a model getter.
+        max_batch_size (int): largest number of inputs run together.
+        timeout (float): seconds to wait for more inputs once the first input
+                        of a batch has arrived.
+        cache (PredictionCache): optional cache of outputs. Inputs in its
+                        in-process tier are answered on `submit` without being
+                        queued. The shared tier is looked up by the batching
+                        thread, and identical inputs in a batch are run once.
+        cache_namespace (str): namespace of the model in the cache, required
+                        with `cache`. See `PredictionCache.namespace`.
+    """
+
+    def __init__(self, session, X, Y, max_batch_size=32, timeout=0.005,
+                 cache=None, cache_namespace=None):
+        if cache is not None and cache_namespace is None:
+            raise ValueError('A cache_namespace is required with a cache')
+        self.session = session
+        self.X = X
+        self.Y = Y
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self.cache = cache
+        self.cache_namespace = cache_namespace
+        # models loaded with a static batch_size get padded batches
+        self._static_batch_size = X.shape.as_list()[0]
+        if self._static_batch_size is not None:
+            self.max_batch_size = min(max_batch_size, self._static_batch_size)
+        self.profile_stats = None
+        self._profile_every = 0
+        self._runs = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop,
+                                        name='tfmodelzoo-predictor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @classmethod
+    def from_getter(cls, getter, session=None, max_batch_size=32,
+                    timeout=0.005, cache=None, cache_namespace=None, **kwargs):
+        """Loads a model with a getter such as `ResNet50` and wraps it.
+
+        # Arguments:
+            getter: one of the model getters of this module.
+            session (Session): TensorFlow session to load the model on. If
+                        not passed, the getter creates one.
+            max_batch_size (int): see `Predictor`.
+            timeout (float): see `Predictor`.
+            cache (PredictionCache): see `Predictor`.
+            cache_namespace (str): see `Predictor`. Defaults to a namespace
+                        derived from the getter and those of its arguments
+                        that affect the outputs.
+            **kwargs: arguments to be passed to the getter.
+        """
+        if cache is not None and cache_namespace is None:
+            cache_namespace = PredictionCache.namespace(
+                getter.__name__, **{name: value for name, value in
+                                    kwargs.items() if name not in
+                                    ('cache', 'session_options', 'warmup')})
+        X, Y = getter(session, **kwargs)[:2]
+        return cls(session or get_session(X), X, Y, max_batch_size, timeout,
+                   cache, cache_namespace)
+
+    def submit(self, x):
+        """Queues a single input (without a batch dimension) and returns a
+        `concurrent.futures.Future` resolving to its output."""
+        if self._closed:
+            raise RuntimeError('Cannot submit to a closed Predictor')
+        future = Future()
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(self.cache_namespace, x)
+            # the shared tier may block, so it is left to the batching thread
+            output = self.cache.get(key, disk=False)
+            if output is not None:
+                future.set_result(output)
+                return future
+        self._queue.put((x, future, key))
+        return future
+
+    def predict(self, x, timeout=None):
+        """Runs a single input (without a batch dimension) and blocks until
+        its output is available."""
+        return self.submit(x).result(timeout)
+
+    def close(self):
+        """Stops the batching thread once all queued inputs have been run."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.time() + self.timeout
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # leave the sentinel for the next call so this batch still runs
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _stack(self, inputs):
+        if self._static_batch_size is not None:
+            inputs = inputs + inputs[-1:] * (self._static_batch_size -
+                                              len(inputs))
+        if isinstance(inputs[0], bytes):
+            # encoded images for models loaded with input_format='jpeg'
+            return np.array(inputs, dtype=object)
+        return np.stack(inputs)
+
+    def warmup(self, batch_sizes=(1, 8, 32)):
+        """Runs random inputs of each batch size through the model, see
+        `warmup`. Batch sizes above `max_batch_size` are never run, and
+        models with a static batch size only run that."""
+        if self._static_batch_size is not None:
+            batch_sizes = [self._static_batch_size]
+        _warmup(self.session, self.X, self.Y,
+                [size for size in batch_sizes if size <= self.max_batch_size])
+
+    def enable_profiling(self, every=100):
+        """Traces one batch in `every`, accumulating per-op and per-layer
+        timings into `self.profile_stats`, a `ProfileStats`."""
+        if self.profile_stats is None:
+            self.profile_stats = ProfileStats()
+        self._profile_every = every
+
+    def disable_profiling(self):
+        """Stops tracing batches, keeping the statistics gathered so far."""
+        self._profile_every = 0
+
+    def _run(self, inputs):
+        self._runs += 1
+        if self._profile_every and self._runs % self._profile_every == 0:
+            run_metadata = tf.RunMetadata()
+            outputs = self.session.run(
+                self.Y, {self.X: inputs}, run_metadata=run_metadata,
+                options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE))
+            self.profile_stats.add(run_metadata)
+            return outputs
+        return self.session.run(self.Y, {self.X: inputs})
+
+    def _deliver(self, key, futures, output):
+        if key is not None:
+            output = self.cache.put(key, output)
+        for future in futures:
+            future.set_result(output)
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # inputs with the same cache key are run once for all their
+            # futures, uncached inputs each on their own
+            groups = OrderedDict()
+            for x, future, key in batch:
+                if future.set_running_or_notify_cancel():
+                    group = groups.setdefault(
+                        id(future) if key is None else key, (x, key, []))
+                    group[2].append(future)
+            groups = list(groups.values())
+            if self.cache is not None:
+                pending = []
+                for x, key, futures in groups:
+                    output = self.cache.get(key) if key is not None else None
+                    if output is None:
+                        pending.append((x, key, futures))
+                        continue
+                    for future in futures:
+                        future.set_result(output)
+                groups = pending
+            if not groups:
+                continue
+            try:
+                outputs = self._run(self._stack([x for x, _, _ in groups]))
+            except Exception as e:
+                if len(groups) == 1:
+                    for future in groups[0][2]:
+                        future.set_exception(e)
+                    continue
+                # run each input on its own, so a bad input only fails itself
+                for x, key, futures in groups:
+                    try:
+                        output = self._run(self._stack([x]))[0]
+                    except Exception as e:
+                        for future in futures:
+                            future.set_exception(e)
+                        continue
+                    self._deliver(key, futures, output)
+                continue
+            for (_, key, futures), output in zip(groups, outputs):
+                self._deliver(key, futures, output)
+
+
+IMAGENET_CLASS_INDEX_URL = ('https://storage.googleapis.com/download.tensorflow'
+                            '.org/data/imagenet_class_index.json')
+_IMAGENET_CLASS_INDEX_HASH = 'c2c37ea517e94d9795004a39431a14cb'
+
+
+def _imagenet_class_index():
+    # use the copy Keras has already downloaded without importing TensorFlow
+    cache_dir = os.environ.get('KERAS_HOME',
+                               os.path.join(os.path.expanduser('~'), '.keras'))
+    path = os.path.join(cache_dir, 'models', 'imagenet_class_index.json')
+    if os.path.exists(path):
+        return path
+    return tf.keras.utils.get_file(
+        'imagenet_class_index.json', IMAGENET_CLASS_INDEX_URL,
+        cache_subdir='models', file_hash=_IMAGENET_CLASS_INDEX_HASH)
+
+
+class LabelDecoder(object):
+    """Maps model outputs to class labels. The label index is loaded once
+    into NumPy arrays and top-k selection is vectorized over the whole batch
+    with `np.argpartition`, so decoding large batches stays cheap.
+
+    # Arguments:
+        path (str): optional label file. Either a JSON class index in the
+                    Keras format (`{"0": ["n01440764", "tench"], ...}`) or a
+                    text file with one label per line, optionally preceded by
+                    an id and a tab. Defaults to the ImageNet class index,
+                    downloaded by Keras on first use.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = _imagenet_class_index()
+        if path.endswith('.json'):
+            with open(path) as f:
+                index = json.load(f)
+            entries = [index[str(i)] for i in range(len(index))]
+        else:
+            with open(path) as f:
+                lines = [line.rstrip('\n') for line in f if line.strip()]
+            entries = [line.split('\t', 1) if '\t' in line else (str(i), line)
+                       for i, line in enumerate(lines)]
+        self.ids = np.array([entry[0] for entry in entries])
+        self.names = np.array([entry[1] for entry in entries])
+
+    def __len__(self):
+        return len(self.names)
+
+    def top_k(self, predictions, k=5):
+        """Returns the `(indices, scores)` of the `k` highest scoring classes
+        of each row of `predictions`, both of shape `(batch, k)` and sorted
+        by decreasing score."""
+        predictions = np.asarray(predictions)
+        if predictions.ndim != 2 or predictions.shape[1] != len(self):
+            raise ValueError('Expected predictions of shape (batch, {}), got '
+                             '{}'.format(len(self), predictions.shape))
+        k = min(k, len(self))
+        indices = np.argpartition(-predictions, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(predictions, indices, axis=1)
+        order = np.argsort(-scores, axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        return indices, scores
+
+    def decode(self, predictions, top=5, structured=False):
+        """Decodes a batch of predictions into their `top` classes.
+
+        # Arguments:
+            predictions: array of shape `(batch, classes)`.
+            top (int): number of classes to return per row.
+            structured (bool): return a structured array of shape
+                        `(batch, top)` with `id`, `name` and `score` fields
+                        instead of lists of tuples.
+
+        # Returns:
+            Lists of `(id, name, score)` tuples, one list per row, as returned
+            by `decode_predictions`, or a structured array.
+        """
+        indices, scores = self.top_k(predictions, top)
+        if structured:
+            decoded = np.empty(indices.shape, dtype=[
+                ('id', self.ids.dtype), ('name', self.names.dtype),
+                ('score', scores.dtype)])
+            decoded['id'] = self.ids[indices]
+            decoded['name'] = self.names[indices]
+            decoded['score'] = scores
+            return decoded
+        ids = self.ids[indices].tolist()
+        names = self.names[indices].tolist()
+        return [list(zip(*row)) for row in zip(ids, names, scores.tolist())]
+
+    def top_k_tensor(self, Y, k=5):
+        """Adds a `tf.nn.top_k` selection onto the output tensor `Y`, so that
+        only `k` scores and indices per row leave the graph. The indices map
+        to labels through `self.names[indices]`.
+
+        # Returns:
+            scores: tensor of shape `(batch, k)`
+            indices: int32 tensor of shape `(batch, k)`
+        """
+        with Y.graph.as_default(), tf.name_scope('top_k'):
+            return tf.nn.top_k(Y, k=min(k, len(self)))
+
+
+_imagenet_decoder = None
+_imagenet_decoder_lock = threading.Lock()
+
+
+def decode_predictions(preds, top=5):
+    """Decodes ImageNet predictions into their `top` classes, as
+    `keras.applications.imagenet_utils.decode_predictions` does, but loading
+    the class index only once per process. See `LabelDecoder`.
+
+    # Returns:
+        A list with one list of `(class_id, class_name, score)` tuples per
+        row of `preds`.
+    """
+    global _imagenet_decoder
+    with _imagenet_decoder_lock:
+        if _imagenet_decoder is None:
+            _imagenet_decoder = LabelDecoder()
+    return _imagenet_decoder.decode(preds, top)
+
+
+def _tile_offsets(size, tile, stride):
+    # regular offsets, plus one flush with the far edge so it is covered too
+    if size < tile:
+        raise ValueError('Image side of {} is smaller than the tile side of '
+                         '{}'.format(size, tile))
+    offsets = list(range(0, size - tile + 1, stride))
+    if offsets[-1] != size - tile:
+        offsets.append(size - tile)
+    return offsets
+
+
+def predict_tiled(session, X, Y, images, tile_size=None, stride=None,
+                  batch_size=64, reduce=None):
+    """Runs a model over overlapping tiles of images larger than its input,
+    batching the tiles of all images together.
+
+    Tiles are taken as NumPy views of the images, so the only copy made is
+    into the batch fed to the model. Tiles are laid out on a regular grid of
+    the given stride, plus a last row and column flush with the images' far
+    edges.
+
+    # Arguments:
+        session (Session): TensorFlow session the model was loaded on.
+        X: the input tensor of the model, as returned by a model getter.
+        Y: the output tensor of the model, as returned by a model getter.
+        images: a list of `(height, width, channels)` arrays, of any sizes.
+        tile_size (tuple): `(height, width)` of the tiles, defaulting to the
+                    static input size of `X`.
+        stride (int): distance between neighbouring tiles, defaulting to half
+                    the tile height, for tiles overlapping by half.
+        batch_size (int): number of tiles run together.
+        reduce (str): `None` to return the output of every tile, or `'mean'`
+                    or `'max'` to aggregate them per image.
+
+    # Returns:
+        One array per image: either a heatmap of shape `(rows, columns) +
+        output_shape` with the output of each tile, or the aggregated output.
+    """
+    if tile_size is None:
+        tile_size = X.shape.as_list()[1:3]
+        if None in tile_size:
+            raise ValueError('A tile_size is required for inputs of '
+                             'unknown size')
+    tile_height, tile_width = tile_size
+    stride = stride or max(1, tile_height // 2)
+    if reduce not in (None, 'mean', 'max'):
+        raise ValueError('Unknown reduce {!r}, expected None, "mean" or '
+                         '"max"'.format(reduce))
+
+    grids = [(_tile_offsets(image.shape[0], tile_height, stride),
+              _tile_offsets(image.shape[1], tile_width, stride))
+             for image in images]
+    tiles = [(i, r, c, y, x) for i, (ys, xs) in enumerate(grids)
+             for r, y in enumerate(ys) for c, x in enumerate(xs)]
+
+    batch, heatmaps = None, [None] * len(images)
+    for start in range(0, len(tiles), batch_size):
+        chunk = tiles[start:start + batch_size]
+        if batch is None:
+            batch = np.empty((batch_size, tile_height, tile_width,
+                              images[0].shape[2]), dtype=images[0].dtype)
+        for j, (i, _, _, y, x) in enumerate(chunk):
+            batch[j] = images[i][y:y + tile_height, x:x + tile_width]
+        outputs = session.run(Y, {X: batch[:len(chunk)]})
+        for (i, r, c, _, _), output in zip(chunk, outputs):
+            if heatmaps[i] is None:
+                ys, xs = grids[i]
+                heatmaps[i] = np.empty((len(ys), len(xs)) + output.shape,
+                                       dtype=outputs.dtype)
+            heatmaps[i][r, c] = output
+
+    if reduce is None:
+        return heatmaps
+    aggregate = np.mean if reduce == 'mean' else np.max
+    return [aggregate(heatmap, axis=(0, 1)) for heatmap in heatmaps]
+
+
+class ProfileStats(object):
+    """Aggregates the per-op compute time and output allocations of traced
+    runs, by op and by Keras layer. Ops are attributed to the layer, or other
+    top-level name scope such as `preprocess`, that their name starts with.
+    """
+
+    def __init__(self):
+        self.steps = 0
+        self.ops = {}
+        self.layers = {}
+        self.step_stats = None
+
+    def add(self, run_metadata):
+        """Adds the step stats of a run traced with `FULL_TRACE`."""
+        self.steps += 1
+        self.step_stats = run_metadata.step_stats
+        for device in run_metadata.step_stats.dev_stats:
+            # GPU streams are also reported aggregated, don't count them twice
+            if device.device.endswith('/stream:all'):
+                continue
+            for node in device.node_stats:
+                name = node.node_name.split(':')[0]
+                label = node.timeline_label
+                op = label.split(' = ')[1].split('(')[0] \
+                    if ' = ' in label else name
+                micros = node.all_end_rel_micros
+                nbytes = sum(
+                    output.tensor_description.allocation_description
+                    .requested_bytes for output in node.output)
+                for key, table in ((op, self.ops),
+                                   (name.split('/')[0], self.layers)):
+                    entry = table.setdefault(key, [0, 0, 0])
+                    entry[0] += 1
+                    entry[1] += micros
+                    entry[2] += nbytes
+
+    def rows(self, by='layer'):
+        """Returns one dict per layer (or op, with `by='op'`) holding the
+        number of op executions per step, the mean time per step in
+        milliseconds and the bytes allocated for outputs per step, sorted by
+        decreasing time."""
+        table = self.layers if by == 'layer' else self.ops
+        steps = max(self.steps, 1)
+        rows = [OrderedDict([('name', name), ('count', count // steps),
+                             ('ms', micros / 1000. / steps),
+                             ('bytes', nbytes // steps)])
+                for name, (count, micros, nbytes) in table.items()]
+        return sorted(rows, key=lambda row: -row['ms'])
+
+    def table(self, by='layer', top=20):
+        """Formats the `top` rows of `rows(by)` as a text table."""
+        rows = self.rows(by)
+        total = sum(row['ms'] for row in rows) or 1.
+        lines = ['{:<40} {:>6} {:>10} {:>7} {:>12}'.format(
+            by, 'count', 'ms', '%', 'bytes')]
+        for row in rows[:top]:
+            lines.append('{:<40} {:>6} {:>10.3f} {:>6.1f}% {:>12}'.format(
+                row['name'][:40], row['count'], row['ms'],
+                100. * row['ms'] / total, row['bytes']))
+        return '\n'.join(lines)
+
+    def write_chrome_trace(self, path):
+        """Writes the last traced run in the Chrome trace format, viewable at
+        chrome://tracing."""
+        from tensorflow.python.client import timeline
+        with open(path, 'w') as f:
+            f.write(timeline.Timeline(self.step_stats)
+                    .generate_chrome_trace_format())
+
+
+def profile(getter, batch_size=1, runs=10, session=None, trace_path=None,
+            **kwargs):
+    """Profiles a model on random inputs, tracing every run.
+
+    # Arguments:
+        getter: one of the model getters of this module, e.g. `ResNet50`.
+        batch_size (int): number of images per run.
+        runs (int): number of traced runs, after one untraced warm-up run.
+        session (Session): optional TensorFlow session to load the model on.
+        trace_path (str): optional file to write a Chrome trace of the last
+                    run to.
+        **kwargs: arguments to be passed to the getter.
+
+    # Returns:
+        A `ProfileStats`, e.g. `print(profile(ResNet50).table())`.
+    """
+    X, Y = getter(session, **kwargs)[:2]
+    session = session or get_session(X)
+    data = _synthetic_batch(X, batch_size)
+
+    session.run(Y, {X: data})
+    stats = ProfileStats()
+    options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+    for _ in range(runs):
+        run_metadata = tf.RunMetadata()
+        session.run(Y, {X: data}, options=options, run_metadata=run_metadata)
+        stats.add(run_metadata)
+    if trace_path is not None:
+        stats.write_chrome_trace(trace_path)
+    return stats
+
+
+class FeatureExtractor(object):
+    """Extracts the activations of several layers of a model with a single
+    forward pass.
+
+    # Arguments:
+        getter: one of the model getters of this module.
+        session (Session): TensorFlow session to load the model on. If
+                        `None`, the getter creates one.
+        layers: Keras layer names (or graph tensor names) to extract.
+        pooling: optional global pooling, `'avg'` or `'max'`, applied to 4D
+                activations in the graph before they are fetched.
+        **kwargs: arguments to be passed to the getter.
+    """
+
+    def __init__(self, getter, session, layers, pooling=None, **kwargs):
+        self.layers = list(layers)
+        self.X, _, *self.tensors = getter(session, include_tensors=self.layers,
+                                          include_pooling=pooling, **kwargs)
+        self.session = session or get_session(self.X)
+
+    def __call__(self, images):
+        """Runs a batch of images and returns an `OrderedDict` mapping each
+        requested layer to its activations."""
+        values = self.session.run(self.tensors, {self.X: images})
+        return OrderedDict(zip(self.layers, values))
+
+
+IMAGE_EXTENSIONS = ('.bmp', '.jpeg', '.jpg', '.png')
+
+
+def _image_paths(inputs):
+    # expand directories into the image files they contain, in sorted order
+    for path in inputs:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+
+
+def _read_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+def predict_files(model, paths, batch_size=32, workers=2, session=None,
+                  **kwargs):
+    """Runs a model over image files, yielding each file's output in order
+    without holding the dataset in memory.
+
+    The model is loaded with `input_format='jpeg'`, so images are decoded,
+    resized and preprocessed in the graph. Up to `workers` batches are read
+    and run concurrently, so reading and decoding the next batches overlaps
+    with the forward pass of the current one.
+
+    # Arguments:
+        model (str): name of the model, e.g. `'ResNet50'`.
+        paths: iterable of image file paths.
+        batch_size (int): number of images run together.
+        workers (int): number of batches in flight at once.
+        session (Session): optional TensorFlow session to load the model on,
+                    created as for the model getters if not passed.
+        **kwargs: arguments to be passed to the getter, e.g.
+                `include_top=False, pooling='avg'` for embeddings.
+
+    # Returns:
+        A generator of `(path, output)` tuples, where `output` is `None` for
+        files that could not be read or decoded.
+    """
+    X, Y = _get_model(session, model, [], input_format='jpeg',
+                      **kwargs)
+    return _predict_paths(session or get_session(X), X, Y, paths, batch_size,
+                          workers)
+
+
+def _predict_paths(session, X, Y, paths, batch_size, workers):
+    def run(batch):
+        contents = [_read_file(path) for path in batch]
+        valid = [i for i, c in enumerate(contents) if c is not None]
+        outputs = [None] * len(batch)
+        try:
+            values = session.run(Y, {X: [contents[i] for i in valid]}) \
+                if valid else []
+            for i, value in zip(valid, values):
+                outputs[i] = value
+        except tf.errors.InvalidArgumentError:
+            # an undecodable file fails the batch, so isolate it
+            for i in valid:
+                try:
+                    outputs[i] = session.run(Y, {X: [contents[i]]})[0]
+                except tf.errors.InvalidArgumentError:
+                    pass
+        return zip(batch, outputs)
+
+    def batches():
+        batch = []
+        for path in paths:
+            batch.append(path)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    with ThreadPoolExecutor(workers) as executor:
+        pending = deque()
+        for batch in batches():
+            pending.append(executor.submit(run, batch))
+            if len(pending) >= workers:
+                for result in pending.popleft().result():
+                    yield result
+        while pending:
+            for result in pending.popleft().result():
+                yield result
+
+
+def _shard_paths(output_dir, shard):
+    prefix = os.path.join(output_dir, 'embeddings-{:05d}'.format(shard))
+    return prefix + '.npy', prefix + '.ids', prefix + '.done'
+
+
+def export_embeddings(model, paths, output_dir, ids=None, shard_size=100000,
+                      dtype='float32', batch_size=32, workers=2, session=None,
+                      **kwargs):
+    """Extracts embeddings of image files into preallocated, memory-mapped
+    `.npy` shards, so that nothing but the current batches is held in memory.
+
+    Each shard is marked complete once written, and calling this again with
+    the same arguments after a crash skips the complete shards. Resuming with
+    different paths or ids raises a `ValueError`. Images that
+    cannot be read or decoded get a row of NaNs.
+
+    # Arguments:
+        model (str): name of the model, e.g. `'ResNet50'`.
+        paths: sequence of image file paths.
+        output_dir (str): directory to write the shards and `index.json` to.
+        ids: optional sequence of source ids, one per path, written alongside
+                    each shard. Defaults to the paths.
+        shard_size (int): number of embeddings per shard.
+        dtype (str): `'float32'`, or `'float16'` to halve the disk usage.
+        batch_size (int): see `predict_files`.
+        workers (int): see `predict_files`.
+        session (Session): optional TensorFlow session to load the model on.
+        **kwargs: arguments to be passed to the getter, defaulting to
+                `include_top=False, pooling='avg'` and the model's default
+                `input_shape`, which images are resized to.
+
+    # Returns:
+        The index written to `index.json`.
+    """
+    kwargs.setdefault('include_top', False)
+    kwargs.setdefault('pooling', 'avg')
+    # jpeg inputs are batched, so they need a fixed size without the top
+    kwargs.setdefault('input_shape', MODELS[model].input_shape)
+    ids = paths if ids is None else ids
+    if len(ids) != len(paths):
+        raise ValueError('Expected one id per path')
+
+    X, Y = _get_model(session, model, [], input_format='jpeg',
+                      **kwargs)
+    session = session or get_session(X)
+    if Y.shape.ndims != 2:
+        raise ValueError('Embeddings must be 2D, use pooling="avg" or "max"')
+
+    # resuming with other paths or ids would mix their shards with these
+    inputs = hashlib.sha256()
+    for path, source_id in zip(paths, ids):
+        inputs.update('{}\0{}\n'.format(path, source_id).encode('utf-8'))
+
+    index = OrderedDict([
+        ('model', model), ('count', len(paths)), ('dim', int(Y.shape[1])),
+        ('dtype', np.dtype(dtype).name), ('shard_size', shard_size),
+        ('shards', (len(paths) + shard_size - 1) // shard_size),
+        ('inputs', inputs.hexdigest())])
+    os.makedirs(output_dir, exist_ok=True)
+    index_path = os.path.join(output_dir, 'index.json')
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            previous = json.load(f)
+        if previous != index:
+            raise ValueError('{} holds a different export: {}'.format(
+                output_dir, previous))
+    else:
+        with open(index_path, 'w') as f:
+            json.dump(index, f, indent=2)
+
+    for shard in range(index['shards']):
+        array_path, ids_path, done_path = _shard_paths(output_dir, shard)
+        if os.path.exists(done_path):
+            continue
+        start = shard * shard_size
+        shard_paths = paths[start:start + shard_size]
+        embeddings = np.lib.format.open_memmap(
+            array_path, mode='w+', dtype=dtype,
+            shape=(len(shard_paths), index['dim']))
+        results = _predict_paths(session, X, Y, shard_paths, batch_size,
+                                 workers)
+        for i, (_, output) in enumerate(results):
+            embeddings[i] = np.nan if output is None else output
+        embeddings.flush()
+        del embeddings
+        with open(ids_path, 'w') as f:
+            for source_id in ids[start:start + shard_size]:
+                f.write('{}\n'.format(source_id))
+        # written last, so that only fully written shards are skipped
+        open(done_path, 'w').close()
+    return index
+
+
+def load_embeddings(output_dir):
+    """Reads embeddings written by `export_embeddings`, yielding the
+    `(ids, embeddings)` of each shard with the embeddings memory-mapped."""
+    with open(os.path.join(output_dir, 'index.json')) as f:
+        index = json.load(f)
+    for shard in range(index['shards']):
+        array_path, ids_path, done_path = _shard_paths(output_dir, shard)
+        if not os.path.exists(done_path):
+            raise IOError('Shard {} of {} is incomplete'.format(shard,
+                                                              output_dir))
+        with open(ids_path) as f:
+            ids = [line.rstrip('\n') for line in f]
+        yield ids, np.load(array_path, mmap_mode='r')
+
+
+def _dataset_fingerprint(paths):
+    # changes when any image is added, removed, renamed or rewritten
+    digest = hashlib.sha256()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            size, mtime = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size, mtime = -1, -1
+        digest.update('{}\0{}\0{}\n'.format(path, size, mtime).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cache_bottlenecks(model, paths, cache_dir, batch_size=32, workers=2,
+                      session=None, **kwargs):
+    """Runs a frozen backbone over image files once and caches its outputs
+    for training a new head, see `train_head`.
+
+    The features are written by `export_embeddings` to a subdirectory of
+    `cache_dir` named after a hash of the model, its arguments, its
+    preprocessing and the paths, sizes and modification times of the images.
+    Calling this again with the same inputs reuses the cache, while changing
+    any of them writes a new one. Image contents are not hashed, so an image
+    rewritten in place with the same size and modification time is not
+    detected and keeps its cached features.
+
+    # Arguments:
+        model (str): name of the backbone, e.g. `'ResNet50'`.
+        paths: sequence of image file paths.
+        cache_dir (str): directory to keep the caches in.
+        batch_size (int): see `predict_files`.
+        workers (int): see `predict_files`.
+        session (Session): optional TensorFlow session to load the backbone
+                    on.
+        **kwargs: arguments to be passed to the getter, defaulting to
+                `include_top=False, pooling='avg'` and the model's default
+                `input_shape`.
+
+    # Returns:
+        The directory of the cache, to be passed to `bottleneck_dataset`.
+    """
+    kwargs.setdefault('include_top', False)
+    kwargs.setdefault('pooling', 'avg')
+    kwargs.setdefault('input_shape', MODELS[model].input_shape)
+    key = OrderedDict([
+        ('model', model), ('kwargs', kwargs),
+        ('preprocessing', _preprocessing_mode(model)),
+        ('dataset', _dataset_fingerprint(paths))])
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True, default=repr)
+                            .encode('utf-8')).hexdigest()
+    directory = os.path.join(cache_dir, '{}-{}'.format(model, digest[:16]))
+    export_embeddings(model, paths, directory, batch_size=batch_size,
+                      workers=workers, session=session, **kwargs)
+    return directory
+
+
+def bottleneck_dataset(directory, labels, batch_size=32, shuffle=True,
+                       seed=None):
+    """Creates a `tf.data` pipeline of `(features, labels)` batches over
+    features cached by `cache_bottlenecks`, in the default graph.
+
+    Rows are gathered from the memory-mapped shards as each batch is needed,
+    so the cache does not have to fit in memory, and the next batch is
+    prefetched while the current one trains. Images that could not be read
+    when caching are left out.
+
+    # Arguments:
+        directory (str): a cache directory as returned by `cache_bottlenecks`.
+        labels: sequence of labels, one per cached image.
+        batch_size (int): number of rows per batch.
+        shuffle (bool): whether to reshuffle the rows every epoch.
+        seed (int): optional shuffling seed.
+
+    # Returns:
+        A repeating `tf.data.Dataset` and the number of batches per epoch.
+    """
+    shards = [embeddings for _, embeddings in load_embeddings(directory)]
+    offsets = np.cumsum([0] + [len(shard) for shard in shards])
+    labels = np.asarray(labels)
+    if len(labels) != offsets[-1]:
+        raise ValueError('Expected {} labels, got {}'.format(offsets[-1],
+                                                             len(labels)))
+
+    # unreadable images were cached as rows of NaNs
+    valid = []
+    for offset, shard in zip(offsets, shards):
+        for start in range(0, len(shard), 4096):
+            rows = np.flatnonzero(~np.isnan(
+                shard[start:start + 4096]).any(axis=1))
+            valid.append(rows + offset + start)
+    valid = np.concatenate(valid) if valid else np.zeros(0, np.int64)
+
+    def gather(indices):
+        # sorted, so that each shard is read front to back
+        indices = np.sort(indices)
+        shard_of = np.searchsorted(offsets, indices, side='right') - 1
+        features = np.empty((len(indices), shards[0].shape[1]), np.float32)
+        for shard in np.unique(shard_of):
+            rows = shard_of == shard
+            features[rows] = shards[shard][indices[rows] - offsets[shard]]
+        return features, labels[indices]
+
+    def load(indices):
+        features, batch_labels = tf.py_func(
+            gather, [indices], [tf.float32, tf.as_dtype(labels.dtype)],
+            stateful=False)
+        features.set_shape((None, shards[0].shape[1]))
+        batch_labels.set_shape((None,) + labels.shape[1:])
+        return features, batch_labels
+
+    dataset = tf.data.Dataset.from_tensor_slices(valid)
+    if shuffle:
+        dataset = dataset.shuffle(len(valid), seed=seed,
+                                  reshuffle_each_iteration=True)
+    dataset = dataset.repeat().batch(batch_size).map(load).prefetch(1)
+    return dataset, (len(valid) + batch_size - 1) // batch_size
+
+
+def train_head(model, paths, labels, cache_dir, head=None, epochs=10,
+               batch_size=32, optimizer='adam',
+               loss='sparse_categorical_crossentropy', **kwargs):
+    """Trains a new head on a frozen backbone from cached features.
+
+    The backbone runs over the images only once (see `cache_bottlenecks`),
+    and every epoch trains the head alone from the cache (see
+    `bottleneck_dataset`), so later epochs and later runs with the same
+    images skip the backbone entirely. The head is trained in a new session,
+    which can be retrieved with `get_session(head.output)`.
+
+    # Arguments:
+        model (str): name of the backbone, e.g. `'ResNet50'`.
+        paths: sequence of image file paths.
+        labels: sequence of labels, one per path.
+        cache_dir (str): directory to keep the feature caches in.
+        head: optional function taking the feature size and returning an
+                    uncompiled Keras model. Defaults to a softmax layer over
+                    the classes in `labels`.
+        epochs (int): number of epochs to train for.
+        batch_size (int): batch size of both the backbone and the head.
+        optimizer: Keras optimizer to compile the head with.
+        loss: Keras loss to compile the head with.
+        **kwargs: arguments to be passed to `cache_bottlenecks`.
+
+    # Returns:
+        The trained Keras head. It applies to the outputs of the backbone
+        getter called with `input_format='jpeg'` and the arguments the
+        features were cached with, i.e. by default `include_top=False`,
+        `pooling='avg'` and the model's default `input_shape`, such as
+        `ResNet50(include_top=False, pooling='avg', input_format='jpeg',
+        input_shape=(224, 224, 3))`. Arrays fed as `input_format='float'`
+        must be preprocessed first, e.g. with `preprocess=True`.
+    """
+    directory = cache_bottlenecks(model, paths, cache_dir,
+                                  batch_size=batch_size, **kwargs)
+    with open(os.path.join(directory, 'index.json')) as f:
+        dim = json.load(f)['dim']
+    labels = np.asarray(labels)
+
+    graph = tf.Graph()
+    sess = tf.Session(graph=graph)
+    _owned_sessions[graph] = sess
+    with graph.as_default(), sess.as_default():
+        dataset, steps = bottleneck_dataset(directory, labels, batch_size)
+        if head is None:
+            head = tf.keras.Sequential([tf.keras.layers.Dense(
+                int(labels.max()) + 1, activation='softmax',
+                input_shape=(dim,))])
+        else:
+            head = head(dim)
+        head.compile(optimizer, loss, metrics=['accuracy'])
+        head.fit(dataset, epochs=epochs, steps_per_epoch=steps)
+    return head
+
+
+def _predict_command(args):
+    paths = list(_image_paths(args.inputs))
+    kwargs = {'batch_size': args.batch_size, 'workers': args.workers}
+    if args.features:
+        # the default input shape, which MODELS[...].features is given for
+        kwargs.update(include_top=False, pooling='avg',
+                      input_shape=MODELS[args.model].input_shape)
+    results = predict_files(args.model, paths, **kwargs)
+
+    if args.features:
+        # embeddings go to a .npy file, row i belonging to line i of .paths
+        shape = (len(paths), MODELS[args.model].features)
+        features = np.lib.format.open_memmap(args.output, mode='w+',
+                                             dtype=np.float32, shape=shape)
+        with open(args.output + '.paths', 'w') as f:
+            for i, (path, output) in enumerate(results):
+                features[i] = np.nan if output is None else output
+                f.write(path + '\n')
+        features.flush()
+        return
+
+    decoder = LabelDecoder(args.labels)
+    with open(args.output, 'w') as f:
+        for path, output in results:
+            record = {'path': path, 'predictions': None}
+            if output is not None:
+                record['predictions'] = [
+                    [label_id, name, float(score)] for label_id, name, score in
+                    decoder.decode(output[np.newaxis], args.top)[0]]
+            f.write(json.dumps(record) + '\n')
+
+
+class InferenceServer(object):
+    """A local HTTP inference server over one or more model replicas.
+
+    Requests are handled by an asyncio event loop and handed to the least
+    busy replica's `Predictor`, which batches requests across connections.
+    Once `queue_max` requests are in flight, further ones are rejected with
+    status 503 rather than queued.
+
+    Endpoints:
+        POST /predict: the body is an encoded image. Responds with JSON
+            `{"predictions": [[id, name, score], ...]}`, or `{"output": [...]}`
+            when `top` is 0.
+        GET /metrics: queue depths, request counts and a latency histogram
+            in the Prometheus text format.
+        GET /health: responds with `ok`.
+
+    # Arguments:
+        predictors: `Predictor`s over models loaded with `input_format='jpeg'`.
+        decoder (LabelDecoder): decoder for the top predictions.
+        queue_max (int): maximum number of requests in flight.
+        top (int): number of top predictions returned, or 0 for the raw
+                output.
+        max_body_bytes (int): largest request body accepted. Larger requests
+                are rejected with status 413 without reading the body.
+    """
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5.,
+                       10.)
+
+    def __init__(self, predictors, decoder=None, queue_max=256, top=5,
+                 max_body_bytes=32 * 2 ** 20):
+        self.predictors = predictors
+        self.decoder = decoder
+        self.queue_max = queue_max
+        self.top = top
+        self.max_body_bytes = max_body_bytes
+        self.in_flight = 0
+        self.responses = {}
+        self.latency_counts = [0] * (len(self.LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.
+
+    def _observe(self, status, seconds):
+        self.responses[status] = self.responses.get(status, 0) + 1
+        self.latency_sum += seconds
+        for i, bound in enumerate(self.LATENCY_BUCKETS + (float('inf'),)):
+            if seconds <= bound:
+                self.latency_counts[i] += 1
+                break
+
+    def metrics(self):
+        """Returns the server's metrics in the Prometheus text format."""
+        lines = ['# TYPE tfmodelzoo_queue_depth gauge',
+                 'tfmodelzoo_queue_depth {}'.format(self.in_flight),
+                 '# TYPE tfmodelzoo_replica_queue_depth gauge']
+        for i, predictor in enumerate(self.predictors):
+            lines.append('tfmodelzoo_replica_queue_depth{{replica="{}"}} {}'
+                         .format(i, predictor._queue.qsize()))
+        lines.append('# TYPE tfmodelzoo_requests_total counter')
+        for status, count in sorted(self.responses.items()):
+            lines.append('tfmodelzoo_requests_total{{status="{}"}} {}'.format(
+                status, count))
+        lines.append('# TYPE tfmodelzoo_request_latency_seconds histogram')
+        cumulative = 0
+        for bound, count in zip(self.LATENCY_BUCKETS + ('+Inf',),
+                                self.latency_counts):
+            cumulative += count
+            lines.append('tfmodelzoo_request_latency_seconds_bucket'
+                         '{{le="{}"}} {}'.format(bound, cumulative))
+        lines.append('tfmodelzoo_request_latency_seconds_sum {}'.format(
+            self.latency_sum))
+        lines.append('tfmodelzoo_request_latency_seconds_count {}'.format(
+            cumulative))
+        cache = self.predictors[0].cache if self.predictors else None
+        if cache is not None:
+            info = cache.info()
+            for name in ('hits', 'disk_hits', 'misses', 'evictions'):
+                lines.append('# TYPE tfmodelzoo_prediction_cache_{}_total '
+                             'counter'.format(name))
+                lines.append('tfmodelzoo_prediction_cache_{}_total {}'.format(
+                    name, info[name]))
+        return '\n'.join(lines) + '\n'
+
+    async def _predict(self, body):
+        if self.in_flight >= self.queue_max:
+            return 503, {'error': 'overloaded'}
+        predictor = min(self.predictors, key=lambda p: p._queue.qsize())
+        self.in_flight += 1
+        try:
+            output = await asyncio.wrap_future(predictor.submit(body))
+        except Exception as e:
+            # only undecodable uploads are the client's fault
+            status = 400 if isinstance(e, tf.errors.InvalidArgumentError) \
+                else 500
+            return status, {'error': str(e).splitlines()[0] if str(e) else
+                            type(e).__name__}
+        finally:
+            self.in_flight -= 1
+        if not self.top:
+            return 200, {'output': output.tolist()}
+        decoded = self.decoder.decode(output[np.newaxis], self.top)[0]
+        return 200, {'predictions': [[label_id, name, float(score)]
+                                     for label_id, name, score in decoded]}
+
+    async def _route(self, method, target, body):
+        path = target.split('?')[0]
+        if method == 'POST' and path == '/predict':
+            start = time.time()
+            status, payload = await self._predict(body)
+            self._observe(status, time.time() - start)
+            return status, 'application/json', json.dumps(payload)
+        if method == 'GET' and path == '/metrics':
+            return 200, 'text/plain; version=0.0.4', self.metrics()
+        if method == 'GET' and path == '/health':
+            return 200, 'text/plain', 'ok\n'
+        return 404, 'application/json', json.dumps({'error': 'not found'})
+
+    async def _handle(self, reader, writer):
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                   413: 'Payload Too Large', 500: 'Internal Server Error',
+                   503: 'Service Unavailable'}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = version == 'HTTP/1.1' and \
+                    headers.get('connection', '').lower() != 'close'
+                length = int(headers.get('content-length', 0))
+                if length > self.max_body_bytes:
+                    # the unread body leaves the connection unusable
+                    keep_alive = False
+                    status, content_type, payload = 413, 'application/json', \
+                        json.dumps({'error': 'body larger than {} bytes'
+                                    .format(self.max_body_bytes)})
+                else:
+                    body = await reader.readexactly(length)
+                    status, content_type, payload = await self._route(
+                        method, target, body)
+                payload = payload.encode('utf-8')
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: {}\r\n'
+                             'Content-Length: {}\r\nConnection: {}\r\n\r\n'
+                             .format(status, reasons[status], content_type,
+                                     len(payload),
+                                     'keep-alive' if keep_alive else 'close')
+                             .encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def run(self, host='127.0.0.1', port=8000):
+        """Serves requests until interrupted, then closes the predictors."""
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(
+            asyncio.start_server(self._handle, host, port, loop=loop)
+            if sys.version_info < (3, 7) else
+            asyncio.start_server(self._handle, host, port))
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+            for predictor in self.predictors:
+                predictor.close()
+
+
+def serve(model, host='127.0.0.1', port=8000, replicas=1, batch_max=64,
+          batch_timeout=0.005, queue_max=256, top=5, labels=None, cache=None,
+          max_body_bytes=32 * 2 ** 20, **kwargs):
+    """Serves a model over HTTP, see `InferenceServer`. Each replica is
+    loaded in a throughput-tuned session pinned to its own group of cores
+    and warmed up before the server starts listening.
+
+    # Arguments:
+        model (str): name of the model, e.g. `'ResNet50'`.
+        host (str): address to listen on.
+        port (int): port to listen on.
+        replicas (int): number of copies of the model to run in parallel.
+        batch_max (int): largest batch run by a replica.
+        batch_timeout (float): seconds a replica waits for a batch to fill.
+        queue_max (int): maximum number of requests in flight.
+        top (int): number of top predictions returned, or 0 for the raw
+                output.
+        labels (str): optional label file for `LabelDecoder`.
+        cache (PredictionCache): optional cache of outputs shared by the
+                replicas, so that duplicate uploads skip the model.
+        max_body_bytes (int): largest upload accepted.
+        **kwargs: arguments to be passed to the getter.
+    """
+    namespace = PredictionCache.namespace(model, input_format='jpeg',
+                                          **kwargs)
+    predictors = []
+    for core_set in core_groups(replicas):
+        X, Y = _get_model(None, model, [], input_format='jpeg',
+                          session_options={'profile': 'throughput',
+                                           'core_set': core_set},
+                          warmup=[1, batch_max], **kwargs)
+        predictors.append(Predictor(get_session(X), X, Y, batch_max,
+                                    batch_timeout, cache, namespace))
+    decoder = LabelDecoder(labels) if top else None
+    InferenceServer(predictors, decoder, queue_max, top,
+                    max_body_bytes).run(host, port)
+
+
+def _serve_command(args):
+    cache = PredictionCache(args.cache_mb * 2 ** 20, args.cache_db) \
+        if args.cache_mb or args.cache_db else None
+    serve(args.model, args.host, args.port, args.replicas, args.batch_max,
+          args.batch_timeout, args.queue_max, args.top, args.labels, cache,
+          args.max_body_mb * 2 ** 20)
+
+
+def _peak_rss_mb():
+    # not available on Windows, hence imported here
+    import resource
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024. * 1024.) if sys.platform == 'darwin' else peak / 1024.
+
+
+def _bench_model(model_name, batch_sizes, threads, runs, warmup_runs):
+    config = tf.ConfigProto(intra_op_parallelism_threads=threads or 0,
+                            inter_op_parallelism_threads=threads or 0)
+    graph = tf.Graph()
+    with graph.as_default(), tf.Session(graph=graph, config=config) as sess, \
+            sess.as_default():
+        # built by the application itself: _build_model also initializes the
+        # variables, which is timed separately below
+        start = time.time()
+        mod = _application(model_name)(weights=None)
+        X, Y = mod.get_input_at(0), mod.get_output_at(0)
+        build_seconds = time.time() - start
+
+        start = time.time()
+        sess.run(tf.global_variables_initializer())
+        init_seconds = time.time() - start
+
+        # time loading a local copy of the weights so no download is needed
+        handle, path = tempfile.mkstemp(suffix='.h5')
+        os.close(handle)
+        try:
+            mod.save_weights(path)
+            start = time.time()
+            mod.load_weights(path)
+            load_seconds = time.time() - start
+        finally:
+            os.remove(path)
+
+        result = OrderedDict([
+            ('model', model_name), ('threads', threads),
+            ('parameters', mod.count_params()),
+            ('build_seconds', build_seconds), ('init_seconds', init_seconds),
+            ('load_seconds', load_seconds), ('batches', [])])
+        shape = tuple(X.shape.as_list()[1:])
+        for batch_size in batch_sizes:
+            data = np.random.uniform(-1, 1, (batch_size,) + shape).astype(
+                np.float32)
+            for _ in range(warmup_runs):
+                sess.run(Y, {X: data})
+            latencies = []
+            for _ in range(runs):
+                start = time.time()
+                sess.run(Y, {X: data})
+                latencies.append(time.time() - start)
+            latencies = np.array(latencies) * 1000.
+            result['batches'].append(OrderedDict([
+                ('batch_size', batch_size),
+                ('p50_ms', float(np.percentile(latencies, 50))),
+                ('p95_ms', float(np.percentile(latencies, 95))),
+                ('p99_ms', float(np.percentile(latencies, 99))),
+                ('images_per_sec', float(batch_size * 1000. /
+                                         latencies.mean()))]))
+        result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def bench(models=None, batch_sizes=(1, 8, 32), threads=(None,), runs=20,
+          warmup_runs=2, isolate=True):
+    """Benchmarks models on randomly initialized weights, so that it runs
+    offline. Each model is built in its own graph and session, and by default
+    in a fresh subprocess, so that its memory and thread pools are not
+    shared with the models benchmarked before it.
+
+    # Arguments:
+        models: names of the models to benchmark, defaulting to all of them.
+        batch_sizes: batch sizes to measure latency and throughput at.
+        threads: values for the session's intra- and inter-op thread pools,
+                `None` leaving the choice to TensorFlow.
+        runs (int): number of timed runs per batch size.
+        warmup_runs (int): number of untimed runs per batch size.
+        isolate (bool): whether to run each model and thread setting in a
+                subprocess of its own. Without it, the peak RSS reported is
+                that of the whole process so far.
+
+    # Returns:
+        A list of dicts, one per model and thread setting, holding the graph
+        construction, variable initialization and weight loading times in
+        seconds, the peak RSS in MB of the process that ran the model
+        (including TensorFlow itself), and per batch size the p50, p95 and
+        p99 latencies in milliseconds and the throughput in images/sec.
+    """
+    import multiprocessing
+
+    results = []
+    for model_name in models or MODELS:
+        for thread_count in threads:
+            args = (model_name, batch_sizes, thread_count, runs, warmup_runs)
+            if not isolate:
+                results.append(_bench_model(*args))
+                continue
+            # ru_maxrss never decreases, so only a new process measures the
+            # peak of one model
+            with multiprocessing.get_context('spawn').Pool(1) as pool:
+                results.append(pool.apply(_bench_model, args))
+    return results
+
+
+def _bench_command(args):
+    results = bench(args.models, args.batch_sizes,
+                    [t or None for t in args.threads], args.runs,
+                    args.warmup_runs)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+def _models_command(args):
+    print(json.dumps([info._asdict() for info in MODELS.values()], indent=2))
+
+
+def _store_command(args):
+    store = WeightStore(args.root)
+    for model_name in args.models:
+        store.add(model_name, args.weights or 'imagenet', not args.exclude_top)
+        print('Added {} to {}'.format(model_name, store.root))
+
+
+def main(argv=None):
+    """Command line entry point, see `python -m tfmodelzoo --help`."""
+    parser = argparse.ArgumentParser(prog='tfmodelzoo')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    parser_models = commands.add_parser(
+        'models', help='describe the available models as JSON')
+    parser_models.set_defaults(func=_models_command)
+
+    parser_bench = commands.add_parser(
+        'bench', help='benchmark models on random weights, emitting JSON')
+    parser_bench.add_argument('--models', nargs='+', choices=list(MODELS))
+    parser_bench.add_argument('--batch-sizes', nargs='+', type=int,
+                              default=[1, 8, 32])
+    parser_bench.add_argument('--threads', nargs='+', type=int, default=[0],
+                              help='thread pool sizes, 0 for the default')
+    parser_bench.add_argument('--runs', type=int, default=20)
+    parser_bench.add_argument('--warmup-runs', type=int, default=2)
+    parser_bench.add_argument('--output', help='file to write the JSON to')
+    parser_bench.set_defaults(func=_bench_command)
+
+    parser_predict = commands.add_parser(
+        'predict', help='run a model over image files or directories')
+    parser_predict.add_argument('inputs', nargs='+',
+                                help='image files or directories of images')
+    parser_predict.add_argument('--model', required=True,
+                                choices=list(MODELS))
+    parser_predict.add_argument('--output', required=True,
+                                help='JSONL file of top predictions, or .npy '
+                                     'file of embeddings with --features')
+    parser_predict.add_argument('--features', action='store_true',
+                                help='write pooled embeddings instead of '
+                                     'predictions')
+    parser_predict.add_argument('--top', type=int, default=5)
+    parser_predict.add_argument('--labels', help='custom label file')
+    parser_predict.add_argument('--batch-size', type=int, default=32)
+    parser_predict.add_argument('--workers', type=int, default=2)
+    parser_predict.set_defaults(func=_predict_command)
+
+    parser_serve = commands.add_parser(
+        'serve', help='serve a model over HTTP with request batching')
+    parser_serve.add_argument('--model', required=True, choices=list(MODELS))
+    parser_serve.add_argument('--host', default='127.0.0.1')
+    parser_serve.add_argument('--port', type=int, default=8000)
+    parser_serve.add_argument('--replicas', type=int, default=1,
+                              help='model copies, each on its own cores')
+    parser_serve.add_argument('--batch-max', type=int, default=64)
+    parser_serve.add_argument('--batch-timeout', type=float, default=0.005,
+                              help='seconds to wait for a batch to fill')
+    parser_serve.add_argument('--queue-max', type=int, default=256,
+                              help='requests in flight before rejecting '
+                                   'with 503')
+    parser_serve.add_argument('--top', type=int, default=5,
+                              help='top predictions returned, 0 for the raw '
+                                   'output')
+    parser_serve.add_argument('--labels', help='custom label file')
+    parser_serve.add_argument('--max-body-mb', type=int, default=32,
+                              help='largest upload accepted')
+    parser_serve.add_argument('--cache-mb', type=int, default=0,
+                              help='memory budget of a cache of outputs for '
+                                   'duplicate images')
+    parser_serve.add_argument('--cache-db',
+                              help='SQLite file caching outputs across '
+                                   'server processes')
+    parser_serve.set_defaults(func=_serve_command)
+
+    parser_store = commands.add_parser(
+        'store', help='convert model weights into a local weight store')
+    parser_store.add_argument('root', help='directory of the weight store')
+    parser_store.add_argument('models', nargs='+', choices=list(MODELS))
+    parser_store.add_argument('--weights',
+                              help='Keras HDF5 weights file to convert instead '
+                                   'of the ImageNet weights')
+    parser_store.add_argument('--exclude-top', action='store_true')
+    parser_store.set_defaults(func=_store_command)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()